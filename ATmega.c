@@ -4,10 +4,22 @@
 
 #define F_CPU 11059200UL
 
+// Must match the GUI baud rate. 38400, 57600 and 115200 are exact with this crystal
+#define UART_BAUD 9600UL
+
+// Binary frame: A5 5A | seq (u16) | count (u8) | count x ADC code (u16) | CRC-16/CCITT (u16)
+#define FRAME_MAGIC_0 0xA5
+#define FRAME_MAGIC_1 0x5A
+#define WIRE_ASCII  0
+#define WIRE_BINARY 1
+
 // FUNCTION PROTOTYPES
 void UART_init(unsigned long USART_BAUDRATE);
 void UART_TxChar(char ch);
 void UART_SendString(char *str);
+unsigned int UART_TxCrc(unsigned char ch, unsigned int crc);
+void UART_SendFrame(unsigned int *codes, unsigned char count);
+void poll_host_command(void);
 unsigned int read_adc_multiple_samples(unsigned char adc_input, unsigned char num_samples);
 unsigned int average_multiple_readings(unsigned char ic_pin_number);
 void set_mux_channel(unsigned char primary_mux, unsigned char secondary_mux);
@@ -19,6 +31,10 @@ unsigned int adc_val = 0;
 float analog = 0.0;
 char buffer[100];
 
+// Wire protocol, switched by the GUI ('B' = binary, 'A' = ASCII)
+unsigned char wire_mode = WIRE_ASCII;
+unsigned int frame_seq = 0;
+
 // Dual MUX tracking
 unsigned char selected_primary_mux = 0;  // PB3/4/5 - Best channel (0-7)
 unsigned char selected_secondary_mux = 0; // PB0/1/2 - Will cycle (0-7)
@@ -53,6 +69,65 @@ void UART_SendString(char *str)
     }
 }
 
+// UART Transmit a byte and fold it into a CRC-16/CCITT (poly 0x1021)
+unsigned int UART_TxCrc(unsigned char ch, unsigned int crc)
+{
+    unsigned char i;
+
+    UART_TxChar(ch);
+    crc ^= (unsigned int)ch << 8;
+    for(i = 0; i < 8; i++)
+    {
+        if(crc & 0x8000)
+            crc = (crc << 1) ^ 0x1021;
+        else
+            crc = crc << 1;
+    }
+    return crc;
+}
+
+// UART Send raw ADC codes as one binary frame
+void UART_SendFrame(unsigned int *codes, unsigned char count)
+{
+    unsigned int crc = 0xFFFF;
+    unsigned char i;
+
+    UART_TxChar(FRAME_MAGIC_0);
+    UART_TxChar(FRAME_MAGIC_1);
+    crc = UART_TxCrc(frame_seq & 0xFF, crc);
+    crc = UART_TxCrc(frame_seq >> 8, crc);
+    crc = UART_TxCrc(count, crc);
+    for(i = 0; i < count; i++)
+    {
+        crc = UART_TxCrc(codes[i] & 0xFF, crc);
+        crc = UART_TxCrc(codes[i] >> 8, crc);
+    }
+    UART_TxChar(crc & 0xFF);
+    UART_TxChar(crc >> 8);
+    frame_seq++;
+}
+
+// Handle protocol requests from the GUI (polled between measurements)
+void poll_host_command(void)
+{
+    char command;
+
+    while(UCSRA & (1<<RXC))
+    {
+        command = UDR;
+        if(command == 'B')
+        {
+            UART_SendString("#BIN\r\n");
+            wire_mode = WIRE_BINARY;
+        }
+        else if(command == 'A')
+        {
+            UART_SendString("#ASCII\r\n");
+            wire_mode = WIRE_ASCII;
+        }
+    }
+}
+
 // Voltage Reference: AREF pin
 #define ADC_VREF_TYPE ((0<<REFS1) | (0<<REFS0) | (0<<ADLAR))
 
@@ -166,6 +241,7 @@ void scan_all_64_channels(void)
 
     for(primary = 0; primary < 8; primary++)
     {
+        poll_host_command();
         cycle_sum = 0;
 
         for(secondary = 0; secondary < 8; secondary++)
@@ -195,6 +271,9 @@ void scan_all_64_channels(void)
 
     // Store the minimum reading
     min_reading = min_cycle_average;
+
+    if(wire_mode == WIRE_BINARY)
+        UART_SendFrame(&channel_readings[0][0], 64);
 }
 
 // Monitor the selected primary channel, cycling through secondary
@@ -202,6 +281,13 @@ void monitor_selected_channel(void)
 {
     unsigned char secondary;
     unsigned int reading;
+    unsigned int codes[8];
+
+    poll_host_command();
+
+    // Frame marker so the GUI can align pin 1 of every cycle
+    if(wire_mode == WIRE_ASCII)
+        UART_SendString("#SYNC\r\n");
 
     for(secondary = 0; secondary < 8; secondary++)
     {
@@ -213,12 +299,20 @@ void monitor_selected_channel(void)
 
         // Take reading
         reading = average_multiple_readings(secondary);
+        codes[secondary] = reading;
+        if(wire_mode == WIRE_BINARY)
+            continue;
+
         analog = (float)reading * 5.0 / 1024.0;
 
         // Send only the voltage value as number (Pin 1-8)
         sprintf(buffer, "%1.3f\r\n", analog);
         UART_SendString(buffer);
     }
+
+    // Binary mode: one checksummed frame of raw codes, no float formatting
+    if(wire_mode == WIRE_BINARY)
+        UART_SendFrame(codes, 8);
 }
 
 void main(void)
@@ -233,7 +327,7 @@ void main(void)
     DDRC &= ~(1 << 3);
     PORTC &= ~(1 << 3);
 
-    UART_init(9600);
+    UART_init(UART_BAUD);
 
     // ADC Setup: Prescaler 128 for maximum accuracy
     ADCSRA = (1 << ADEN) | (1 << ADPS2) | (1 << ADPS1) | (1 << ADPS0);
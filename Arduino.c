@@ -39,6 +39,9 @@ void loop() {
 */
 
 
+  // Frame marker so the GUI can align pin 1 of every cycle
+  Serial.println("#SYNC");
+
 //1
   digitalWrite(switch1 ,0); digitalWrite(switch1,0); digitalWrite(switch3,0);    
   delay(50);
@@ -1,18 +1,26 @@
+import time
+IMPORT_START = time.perf_counter()
+
+# matplotlib, PIL.ImageTk, pymongo and ic_store (gridfs) are imported where
+# they are first needed, so the window comes up before they load
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-import serial
-import time
 import threading
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
-from PIL import Image, ImageTk
 import os
-import io
-import base64
 from datetime import datetime
-import pymongo
-from bson.binary import Binary
+from nn_index import create_signature_index
+from photo_cache import PhotoCache, PhotoUnavailable
+from photo_prefetch import PhotoPrefetcher
+from live_ranking import LiveRanker
+from ui_updates import UIUpdateQueue
+from event_log import EventLog
+from live_plot import LivePlot
+import acquisition
+from tester_engine import ICTester
+from startup_report import StartupReport
+
+IMPORTS_DONE = time.perf_counter()
 
 
 class MongoDBICTesterGUI:
@@ -22,30 +30,108 @@ class MongoDBICTesterGUI:
         self.root.geometry("1600x1000")
         self.root.minsize(1400, 800)
 
+        # Startup timing, logged once the window is idle and the background
+        # connection has finished
+        self.startup = StartupReport(IMPORT_START, on_complete=self.log_startup_report)
+        self.startup.expect("window interactive", "database ready", "plots")
+        self.startup.add("imports", IMPORT_START, IMPORTS_DONE - IMPORT_START)
+
         # Variables
         self.port_var = tk.StringVar(value="COM4")
         self.baudrate_var = tk.StringVar(value="9600")
+        self.protocol_var = tk.StringVar(value="Auto")
         self.mongo_uri_var = tk.StringVar(
             value="mongodb+srv://Group23:<db_password>@cluster0.mh3csnt.mongodb.net/?appName=Cluster0")
         self.db_name_var = tk.StringVar(value="ic_tester")
         self.collection_name_var = tk.StringVar(value="ic_database")
+        self.match_mode_var = tk.StringVar(value="Local")
+        # Matching mode and live ranking as read when the current run started
+        self.run_match_mode = "local"
+        self.live_ranking = False
+
+        # Widget updates from worker threads are batched and applied by the
+        # Tk loop once per tick (~30 fps)
+        self.ui = UIUpdateQueue()
+        self.ui_interval = 33
+
+        # Log lines go to a bounded ring buffer (shown in the Log tab, which
+        # keeps at most log_view_lines) and to a rotating file in the background
+        self.event_log = EventLog()
+        self.log_view_lines = 2000
+        self.log_seq = 0
+        self.log_skipped = 0
+        self.adaptive_var = tk.BooleanVar(value=True)
+        self.live_var = tk.BooleanVar(value=False)
+        self.live_plot_var = tk.BooleanVar(value=True)
+        self.plot_fps = 15
+
+        # Live mode re-ranks the running signature after every frame
+        self.live_ranker = LiveRanker(self.rank_measurement, k=10)
 
         self.collecting = False
-        self.serial_conn = None
+        self.identification = None
+        self.pin_stats = None
         self.messages = []
         self.current_buffer = []
         self.averaged_array = []
         self.comparison_results = []
         self.current_photo = None
         self.current_image = None
+        self.photo_cache = PhotoCache()
+
+        # Photos of the top matches are rendered ahead of time
+        self.prefetch_count = 5
+        self.photo_prefetcher = PhotoPrefetcher(self.photo_cache, self.fetch_photo)
+        self.prefetched_photos = {}
+        self.pending_photo = None
+        # IC whose photo display_ic_photo is loading
+        self.photo_request = None
+
+        # Cached reference signatures, ranked in memory. "kdtree" avoids
+        # scoring every row on large libraries (index_eps > 0 makes it
+        # approximate); "sharded" scores the rows in worker processes
+        self.index_backend = "brute"
+        self.index_eps = 0.0
+        options = {"eps": self.index_eps} if self.index_backend == "kdtree" else {}
+        self.signature_index = create_signature_index(self.index_backend, **options)
+        self.max_results = 100
+        self.signature_cache = None
+
+        # Acquisition, statistics and matching run in the headless engine.
+        # Fixed mode takes fixed_messages; adaptive mode stops between
+        # min_messages and max_messages once the best match is significant.
+        # Outlier frames are left out of the signature. weight_noisy_pins
+        # ranks by inverse-variance weighted SSE (all matching modes)
+        self.tester = ICTester(self.signature_index, max_results=self.max_results,
+                               fixed_messages=5, min_messages=1, max_messages=10,
+                               confidence=0.99, weight_noisy_pins=False,
+                               log=self.update_status)
 
         # MongoDB connection
         self.mongo_client = None
         self.db = None
         self.collection = None
-
-        self.setup_ui()
-        self.connect_mongodb()
+        self.store = None
+        self.connect_thread = None
+        # "<f4"/"<f8" stores readings and messages as compact Binary blobs
+        self.compact_dtype = None
+
+        # Plots are built once matplotlib has been imported in the background
+        self.fig = None
+        self.live_plot = None
+
+        with self.startup.phase("setup_ui"):
+            self.setup_ui()
+        self.root.after(50, self.poll_prefetched_photos)
+        self.root.after(100, self.poll_live_ranking)
+        self.root.after(self.ui_interval, self.apply_ui_updates)
+        self.root.after_idle(self.startup.mark, "window interactive")
+
+        # The local signature cache, then the cloud, off the Tk thread
+        self.connect_thread = threading.Thread(target=self.load_in_background,
+                                               args=self.mongo_settings() + (False,), daemon=True)
+        self.connect_thread.start()
+        threading.Thread(target=self.import_plotting, daemon=True).start()
 
     def setup_ui(self):
         # Main container
@@ -127,6 +213,27 @@ class MongoDBICTesterGUI:
         baud_combo.grid(row=row, column=1, sticky=(tk.W, tk.E), pady=5, padx=(5, 0))
         row += 1
 
+        ttk.Label(left_panel, text="Protocol:").grid(row=row, column=0, sticky=tk.W, pady=5)
+        protocol_combo = ttk.Combobox(left_panel, textvariable=self.protocol_var,
+                                      values=["Auto", "ASCII", "Binary"], state="readonly")
+        protocol_combo.grid(row=row, column=1, sticky=(tk.W, tk.E), pady=5, padx=(5, 0))
+        row += 1
+
+        ttk.Checkbutton(left_panel, text="Adaptive sampling (stop when decided)",
+                        variable=self.adaptive_var).grid(row=row, column=0, columnspan=2,
+                                                         sticky=tk.W, pady=5)
+        row += 1
+
+        ttk.Checkbutton(left_panel, text="Live ranking while collecting",
+                        variable=self.live_var).grid(row=row, column=0, columnspan=2,
+                                                     sticky=tk.W, pady=5)
+        row += 1
+
+        ttk.Checkbutton(left_panel, text="Live plot while collecting",
+                        variable=self.live_plot_var).grid(row=row, column=0, columnspan=2,
+                                                          sticky=tk.W, pady=5)
+        row += 1
+
         # Progress bar
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(left_panel, variable=self.progress_var, maximum=5)
@@ -146,6 +253,13 @@ class MongoDBICTesterGUI:
                                    command=self.stop_collection, state=tk.DISABLED, width=15)
         self.stop_btn.pack(side=tk.LEFT)
 
+        # Matching mode: local signature index or MongoDB aggregation
+        ttk.Label(left_panel, text="Matching:").grid(row=row, column=0, sticky=tk.W, pady=5)
+        match_combo = ttk.Combobox(left_panel, textvariable=self.match_mode_var,
+                                   values=["Local", "Server"], state="readonly")
+        match_combo.grid(row=row, column=1, sticky=(tk.W, tk.E), pady=5, padx=(5, 0))
+        row += 1
+
         # Compare Button
         self.compare_btn = ttk.Button(left_panel, text="Compare with Database",
                                       command=self.compare_with_database, state=tk.DISABLED)
@@ -168,6 +282,15 @@ class MongoDBICTesterGUI:
         self.view_db_btn = ttk.Button(left_panel, text="View Database",
                                       command=self.view_database)
         self.view_db_btn.grid(row=row, column=0, columnspan=2, pady=5)
+        row += 1
+
+        # Bulk library import / export
+        library_frame = ttk.Frame(left_panel)
+        library_frame.grid(row=row, column=0, columnspan=2, pady=5)
+        ttk.Button(library_frame, text="Import Library...",
+                   command=self.import_library).grid(row=0, column=0, padx=5)
+        ttk.Button(library_frame, text="Export Library...",
+                   command=self.export_library).grid(row=0, column=1, padx=5)
 
         # Right panel - Data Display
         right_panel = ttk.LabelFrame(main_frame, text="Data & Results", padding="10")
@@ -258,6 +381,8 @@ class MongoDBICTesterGUI:
                 self.results_tree.column(col, width=200)
             else:
                 self.results_tree.column(col, width=100)
+        if self.tester.weight_noisy_pins:
+            self.results_tree.heading("SSE", text="Weighted SSE")
 
         self.results_tree.bind('<<TreeviewSelect>>', self.on_result_selected)
 
@@ -275,14 +400,7 @@ class MongoDBICTesterGUI:
         viz_tab.columnconfigure(0, weight=1)
         viz_tab.rowconfigure(0, weight=1)
 
-        self.fig, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(5, 4))
-        self.fig.text(0.02, 0.98, 'Group 23', fontsize=10,
-                      fontweight='bold', color='blue',
-                      verticalalignment='top')
-        self.fig.tight_layout(pad=3.0, rect=[0.05, 0.05, 0.95, 0.95])
-
-        self.canvas = FigureCanvasTkAgg(self.fig, viz_tab)
-        self.canvas.get_tk_widget().grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.viz_tab = viz_tab
 
         # Status bar
         status_frame = ttk.Frame(main_frame)
@@ -300,92 +418,288 @@ class MongoDBICTesterGUI:
                                relief=tk.SUNKEN)
         status_info.grid(row=0, column=1, ipadx=10, ipady=2, sticky=tk.E)
 
+    def mongo_settings(self):
+        return self.mongo_uri_var.get(), self.db_name_var.get(), self.collection_name_var.get()
+
     def connect_mongodb(self):
-        """Connect to MongoDB"""
+        """Reconnect to MongoDB without blocking the window"""
+        if self.connect_thread and self.connect_thread.is_alive():
+            self.update_status("Already connecting to MongoDB...", stage="database")
+            return
+        self.connect_thread = threading.Thread(target=self.connect_in_background,
+                                               args=self.mongo_settings() + (True,), daemon=True)
+        self.connect_thread.start()
+
+    def load_in_background(self, uri, db_name, collection_name, notify):
+        """Startup: local cache first so matching works before (or without) the cloud"""
+        with self.startup.phase("signature cache"):
+            self.sync_signature_cache(db_name, collection_name)
+        with self.startup.phase("database ready"):
+            self.connect_in_background(uri, db_name, collection_name, notify)
+
+    def connect_in_background(self, uri, db_name, collection_name, notify):
+        """Connect to MongoDB; runs on a worker thread, notify shows a dialog"""
         try:
             if self.mongo_client:
                 self.mongo_client.close()
 
-            self.update_status("Connecting to MongoDB...")
-            self.mongo_client = pymongo.MongoClient(self.mongo_uri_var.get(), serverSelectionTimeoutMS=5000)
-
-            # Test connection
-            self.mongo_client.server_info()
-
-            self.db = self.mongo_client[self.db_name_var.get()]
-            self.collection = self.db[self.collection_name_var.get()]
-
-            # Create indexes
-            self.collection.create_index("ic_name")
-            self.collection.create_index("timestamp")
-
-            count = self.collection.count_documents({})
-            self.update_status(f"✓ Connected to MongoDB. Database has {count} ICs.")
-            messagebox.showinfo("Success",
-                                f"Connected to MongoDB!\nDatabase: {self.db_name_var.get()}\nICs in database: {count}")
+            self.update_status("Connecting to MongoDB...", stage="database")
+            with self.startup.phase("pymongo import"):
+                import pymongo
+                from ic_store import ICStore
+
+            with self.startup.phase("server selection"):
+                self.mongo_client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
+                # Test connection
+                self.mongo_client.server_info()
+
+            self.db = self.mongo_client[db_name]
+            self.collection = self.db[collection_name]
+            self.store = ICStore(self.collection, compact_dtype=self.compact_dtype)
+            self.tester.store = self.store
+            self.photo_cache.clear()
+
+            # Only missing indexes are created
+            with self.startup.phase("index check"):
+                self.store.ensure_indexes()
+
+            # Pull signature changes since the last sync
+            with self.startup.phase("signature sync"):
+                self.sync_signature_cache(db_name, collection_name)
+
+            # Estimated from collection metadata, no scan
+            count = self.store.count()
+            self.update_status(f"✓ Connected to MongoDB. Database has ~{count} ICs.", stage="database")
+            if notify:
+                self.ui.call(messagebox.showinfo, "Success",
+                             f"Connected to MongoDB!\nDatabase: {db_name}\nICs in database: ~{count}")
 
         except Exception as e:
-            self.update_status(f"✗ MongoDB connection failed: {e}")
-            messagebox.showerror("MongoDB Error", f"Failed to connect:\n{str(e)}")
-
-    def log_message(self, message):
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+            self.collection = None
+            self.store = None
+            self.tester.store = None
+            self.sync_signature_cache(db_name, collection_name)
+            self.update_status(f"✗ MongoDB connection failed: {e}", stage="database")
+            if notify:
+                self.ui.call(messagebox.showerror, "MongoDB Error", f"Failed to connect:\n{str(e)}")
+
+    def sync_signature_cache(self, db_name=None, collection_name=None):
+        """Load the on-disk signature cache and delta-sync it from MongoDB"""
+        self.signature_cache = self.tester.load_signatures(db_name or self.db_name_var.get(),
+                                                           collection_name or self.collection_name_var.get())
+
+    def import_plotting(self):
+        """Import matplotlib off the Tk thread, then build the plots on it"""
+        with self.startup.phase("matplotlib import"):
+            import matplotlib.figure
+            import matplotlib.backends.backend_tkagg
+        self.ui.call(self.build_plots)
+
+    def build_plots(self):
+        """Create the figure and live plot (imports matplotlib if still needed)"""
+        if self.fig is not None:
+            return
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        with self.startup.phase("plots"):
+            # A bare Figure; pyplot's figure manager is not needed inside Tk
+            self.fig = Figure(figsize=(5, 4))
+            self.ax1, self.ax2 = self.fig.subplots(2, 1)
+            self.fig.text(0.02, 0.98, 'Group 23', fontsize=10,
+                          fontweight='bold', color='blue',
+                          verticalalignment='top')
+            self.fig.tight_layout(pad=3.0, rect=[0.05, 0.05, 0.95, 0.95])
+
+            self.canvas = FigureCanvasTkAgg(self.fig, self.viz_tab)
+            self.canvas.get_tk_widget().grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+            # Streams a rolling window of pin voltages into the top axes while collecting
+            self.live_plot = LivePlot(self.canvas, self.ax1, fps=self.plot_fps)
+
+    def log_startup_report(self, report):
+        for line in report.summary():
+            self.log_message(f"Startup {line}", stage="startup")
+
+    def log_message(self, message, stage="gui"):
+        self.event_log.write(message, stage)
+
+    def update_status(self, message, stage="gui"):
+        """Safe from any thread; shown on the next UI tick"""
+        self.ui.set_status(message)
+        self.log_message(message, stage)
+
+    def refresh_log_view(self):
+        """Append new log lines in one insert and trim the view to log_view_lines"""
+        self.log_seq, lines, skipped = self.event_log.lines_since(self.log_seq)
+        if skipped:
+            self.log_skipped += skipped
+            lines.insert(0, f"... {skipped} lines not shown, see {self.event_log.path} ...")
+        if not lines:
+            return
 
-    def update_status(self, message):
-        self.status_var.set(message)
-        self.log_message(message)
+        follow = self.log_text.yview()[1] >= 0.999
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.log_view_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        # Only scroll when the operator is not reading older lines
+        if follow:
+            self.log_text.see(tk.END)
+
+    def apply_ui_updates(self):
+        """Apply everything posted since the last tick in one repaint"""
+        try:
+            batch = self.ui.take()
+            if batch is not None:
+                for index, value in batch.values.items():
+                    self.update_value_display(index, value)
+                if batch.progress is not None:
+                    self.update_progress(*batch.progress)
+                if batch.status is not None:
+                    self.status_var.set(batch.status)
+                for fn, args in batch.calls:
+                    # One failing call must not drop the rest of the batch
+                    try:
+                        fn(*args)
+                    except Exception as e:
+                        self.log_message(f"UI update {getattr(fn, '__name__', fn)} failed: {e}")
+            if self.live_plot:
+                self.live_plot.refresh()
+            self.refresh_log_view()
+        finally:
+            # Always reschedule, or the UI would stop updating for good
+            self.root.after(self.ui_interval, self.apply_ui_updates)
 
     def update_value_display(self, index, value):
         if index < len(self.value_labels):
             self.value_labels[index].config(text=f"{value:.3f}")
 
     def update_progress(self, current, total=5):
+        self.progress_bar.config(maximum=total)
         self.progress_var.set(current)
         self.message_label.config(text=f"Messages: {current}/{total}")
 
-    def display_ic_photo(self, ic_name):
-        """Display the photo of the selected IC from MongoDB"""
-        try:
-            self.ic_info_label.config(text=f"Loading photo for: {ic_name}...")
-            self.root.update()
-
-            # Find IC document in MongoDB
-            ic_doc = self.collection.find_one({"ic_name": ic_name})
-
-            if ic_doc and "photo" in ic_doc:
-                # Decode base64 image
-                image_data = base64.b64decode(ic_doc["photo"])
-                image_stream = io.BytesIO(image_data)
-                self.current_image = Image.open(image_stream)
+    def photo_target_size(self):
+        """Thumbnail size that fits the photo label"""
+        label_width = self.photo_label.winfo_width()
+        label_height = self.photo_label.winfo_height()
 
-                # Get label size
-                label_width = self.photo_label.winfo_width()
-                label_height = self.photo_label.winfo_height()
+        if label_width < 100 or label_height < 100:
+            return (600, 600)
+        return (label_width - 20, label_height - 20)
 
-                if label_width < 100 or label_height < 100:
-                    max_size = (600, 600)
-                else:
-                    max_size = (label_width - 20, label_height - 20)
-
-                # Resize
-                self.current_image.thumbnail(max_size, Image.Resampling.LANCZOS)
-                self.current_photo = ImageTk.PhotoImage(self.current_image)
+    def display_ic_photo(self, ic_name):
+        """Load the photo of the selected IC on a worker thread (call from the Tk thread)"""
+        self.photo_request = ic_name
+        self.ic_info_label.config(text=f"Loading photo for: {ic_name}...")
+        threading.Thread(target=self.load_ic_photo, args=(ic_name, self.photo_target_size()),
+                         daemon=True).start()
+
+    def load_ic_photo(self, ic_name, max_size):
+        """Worker thread: render the thumbnail, then hand it to the Tk thread"""
+        try:
+            # Decoded photos and thumbnails are cached per (ic_name, size)
+            thumbnail, error = self.photo_cache.get_thumbnail(ic_name, max_size, self.fetch_photo), None
+        except Exception as e:
+            thumbnail, error = None, e
+        self.ui.call(self.show_ic_photo, ic_name, thumbnail, error)
 
-                self.photo_label.config(image=self.current_photo, text="")
-                self.ic_info_label.config(text=f"IC: {ic_name}")
-                self.update_status(f"Photo loaded for: {ic_name}")
-            else:
-                self.photo_label.config(image='',
-                                        text=f"No photo found for:\n{ic_name}")
-                self.ic_info_label.config(text=f"IC: {ic_name} (No Image)")
-                self.update_status(f"No photo in database for: {ic_name}")
+    def show_ic_photo(self, ic_name, thumbnail, error):
+        """Tk thread: show a photo loaded by load_ic_photo"""
+        if ic_name != self.photo_request:
+            # Another IC was selected meanwhile
+            return
+        self.photo_request = None
+
+        if isinstance(error, PhotoUnavailable):
+            self.photo_label.config(image='', text=f"Photo unavailable:\n{error}")
+            self.ic_info_label.config(text=f"IC: {ic_name}")
+            self.update_status(f"Photo unavailable for {ic_name}: {error}", stage="photos")
+        elif error is not None:
+            self.update_status(f"Error loading photo: {error}", stage="photos")
+            self.photo_label.config(image='', text=f"Error loading photo\n{str(error)[:50]}...")
+        elif thumbnail is not None:
+            self.current_image = thumbnail
+            from PIL import ImageTk
+            self.current_photo = ImageTk.PhotoImage(self.current_image)
+
+            self.photo_label.config(image=self.current_photo, text="")
+            self.ic_info_label.config(text=f"IC: {ic_name}")
+            stats = self.photo_cache.stats()
+            self.update_status(f"Photo loaded for: {ic_name} "
+                               f"(cache hits: {stats['hits']}, misses: {stats['misses']})",
+                               stage="photos")
+        else:
+            self.photo_label.config(image='',
+                                    text=f"No photo found for:\n{ic_name}")
+            self.ic_info_label.config(text=f"IC: {ic_name} (No Image)")
+            self.update_status(f"No photo in database for: {ic_name}", stage="photos")
+
+    def fetch_photo(self, ic_name, max_size):
+        """Smallest stored rendition covering max_size, None if there is no photo"""
+        if self.store is None:
+            raise PhotoUnavailable("not connected to MongoDB")
+        return self.store.get_photo(ic_name, max_size)
+
+    def show_prefetched_photo(self, ic_name):
+        """Show a photo already rendered by the prefetcher, False if there is none"""
+        entry = self.prefetched_photos.get(ic_name)
+        if entry is None or entry[0] != self.photo_target_size():
+            return False
+
+        photo = entry[1]
+        if photo is not None:
+            self.current_photo = photo
+            self.photo_label.config(image=photo, text="")
+            self.ic_info_label.config(text=f"IC: {ic_name}")
+        else:
+            self.photo_label.config(image='', text=f"No photo found for:\n{ic_name}")
+            self.ic_info_label.config(text=f"IC: {ic_name} (No Image)")
+        return True
+
+    def start_photo_prefetch(self, ic_names):
+        """Render photos of the top matches in the background, best first"""
+        self.prefetched_photos = {}
+        self.photo_request = None
+        self.pending_photo = ic_names[0] if ic_names else None
+        if self.pending_photo:
+            self.ic_info_label.config(text=f"Loading photo for: {self.pending_photo}...")
+        self.photo_prefetcher.prefetch(ic_names, self.photo_target_size())
+
+    def poll_prefetched_photos(self):
+        """Collect finished prefetches on the Tk thread"""
+        for ic_name, max_size, thumbnail, error in self.photo_prefetcher.drain():
+            if error is not None:
+                self.update_status(f"Error prefetching photo for {ic_name}: {error}", stage="photos")
+                if ic_name == self.pending_photo:
+                    self.pending_photo = None
+                    self.display_ic_photo(ic_name)
+                continue
+
+            from PIL import ImageTk
+            photo = ImageTk.PhotoImage(thumbnail) if thumbnail is not None else None
+            self.prefetched_photos[ic_name] = (max_size, photo)
+
+            if ic_name == self.pending_photo:
+                self.pending_photo = None
+                self.show_prefetched_photo(ic_name)
+
+        self.root.after(50, self.poll_prefetched_photos)
+
+    def poll_live_ranking(self):
+        """Show the newest live ranking on the Tk thread"""
+        latest = self.live_ranker.latest()
+        if latest is not None:
+            frames, results, error = latest
+            if error is not None:
+                self.update_status(f"Live ranking error: {error}", stage="matching")
+            elif results:
+                self.fill_results_tree(results)
+                best_name, best_sse, _ = results[0]
+                self.ui.set_status(f"Live after {frames} messages: {best_name} (SSE: {best_sse:.4f})")
 
-        except Exception as e:
-            self.update_status(f"Error loading photo: {e}")
-            self.photo_label.config(image='', text=f"Error loading photo\n{str(e)[:50]}...")
+        self.root.after(100, self.poll_live_ranking)
 
     def on_result_selected(self, event):
         """Handle selection of a result"""
@@ -395,13 +709,25 @@ class MongoDBICTesterGUI:
             values = item['values']
             if values and len(values) >= 2:
                 ic_name = values[1]
-                threading.Thread(target=self.display_ic_photo, args=(ic_name,), daemon=True).start()
+                if ic_name == self.pending_photo:
+                    # Still being prefetched, shown when it arrives
+                    return
+                self.pending_photo = None
+                self.photo_request = None
+                if self.show_prefetched_photo(ic_name):
+                    return
+                self.display_ic_photo(ic_name)
 
     def start_collection(self):
         if self.collecting:
             return
 
         self.collecting = True
+        self.live_ranker.cancel()
+        self.photo_prefetcher.cancel()
+        self.prefetched_photos = {}
+        self.pending_photo = None
+        self.identification = None
         self.messages = []
         self.current_buffer = []
         self.averaged_array = []
@@ -413,92 +739,144 @@ class MongoDBICTesterGUI:
 
         for label in self.value_labels:
             label.config(text="0.000")
+        if self.live_plot_var.get() and self.live_plot:
+            # One x slot per message this run can collect
+            self.live_plot.start(self.tester.max_messages if self.adaptive_var.get()
+                                 else self.tester.fixed_messages)
         self.results_tree.delete(*self.results_tree.get_children())
         self.photo_label.config(image='', text="No photo available")
         self.ic_info_label.config(text="")
 
-        self.collection_thread = threading.Thread(target=self.collect_data, daemon=True)
+        # Tk variables are read here, on the Tk thread
+        self.run_match_mode = self.match_mode_var.get().lower()
+        settings = (self.port_var.get(), self.baudrate_var.get(), self.protocol_var.get().lower(),
+                    self.run_match_mode, self.adaptive_var.get(), self.live_var.get())
+        self.collection_thread = threading.Thread(target=self.collect_data, args=settings,
+                                                  daemon=True)
         self.collection_thread.start()
 
-    def collect_data(self):
+    def collect_data(self, port, baudrate, protocol, match_mode, adaptive, live_ranking):
         try:
-            self.update_status(f"Connecting to {self.port_var.get()}...")
-
-            self.serial_conn = serial.Serial(
-                port=self.port_var.get(),
-                baudrate=int(self.baudrate_var.get()),
-                timeout=1
-            )
-            time.sleep(2)
-
-            self.update_status("Connected. Reading values...")
-
-            while self.collecting and len(self.messages) < 5:
-                if self.serial_conn.in_waiting > 0:
-                    raw = self.serial_conn.readline().decode('utf-8').strip()
+            baudrate = int(baudrate)
+
+            # The engine reads and parses on its own thread and this thread
+            # only blocks on its event queue. The port stays open between
+            # tests, so later tests start immediately
+            self.live_ranking = live_ranking
+            self.tester.adaptive = adaptive
+            self.tester.open(port, baudrate, protocol)
+            self.update_status("Reading values...", stage="acquisition")
+            self.ui.set_progress(0, self.tester.max_messages if self.tester.adaptive
+                                 else self.tester.fixed_messages)
+
+            # Matching waits for Compare, so the run only collects
+            result = self.tester.identify(on_event=self.handle_acquisition_event,
+                                          should_stop=lambda: not self.collecting,
+                                          match=False, match_mode=match_mode)
+            self.identification = result
+            self.messages = result.messages
+            self.pin_stats = result.stats
+
+            ui_stats = self.ui.stats
+            self.update_status(f"UI updates: {ui_stats['posted']} posted, {ui_stats['merged']} merged, "
+                               f"{self.log_skipped} log lines skipped", stage="acquisition")
+
+            if result.complete:
+                self.compute_average()
+                self.update_status("Data collection complete!", stage="acquisition")
+                self.ui.call(self.enable_compare_button)
 
-                    if raw:
-                        try:
-                            value = float(raw)
-                            idx = len(self.current_buffer)
+        except Exception as e:
+            self.update_status(f"Error: {e}", stage="acquisition")
+            self.ui.call(messagebox.showerror, "Error", str(e))
 
-                            self.root.after(0, self.update_value_display, idx, value)
-                            self.current_buffer.append(value)
+        finally:
+            self.stop_collection()
 
-                            if len(self.current_buffer) == 8:
-                                self.messages.append(self.current_buffer.copy())
-                                current_count = len(self.messages)
+    def handle_acquisition_event(self, event, result):
+        """Per-event UI updates, called on the collection thread"""
+        kind, idx, payload = event
 
-                                self.root.after(0, self.update_progress, current_count)
-                                self.update_status(f"Message #{current_count} complete")
-                                self.current_buffer = []
+        if kind == acquisition.VALUE:
+            self.ui.set_value(idx, payload)
+            self.current_buffer.append(payload)
 
-                                for i in range(8):
-                                    self.root.after(0, self.update_value_display, i, 0.0)
+        elif kind == acquisition.FRAME:
+            self.messages = result.messages
+            self.pin_stats = result.stats
+            current_count = len(result.messages)
+            if self.live_plot and self.live_plot.active:
+                self.live_plot.push(payload)
 
-                        except ValueError:
-                            self.update_status(f"Invalid value: {raw}")
+            self.ui.set_progress(current_count, result.target)
+            self.update_status(f"Message #{current_count} complete", stage="acquisition")
+            self.current_buffer = []
 
-            if len(self.messages) == 5:
-                self.compute_average()
-                self.update_status("Data collection complete!")
-                self.root.after(0, self.enable_compare_button)
+            self.ui.set_values([0.0] * 8)
 
-        except Exception as e:
-            self.update_status(f"Error: {e}")
-            messagebox.showerror("Error", str(e))
-
-        finally:
-            self.stop_collection()
+            if not result.accepted:
+                self.update_status(f"Message #{current_count} flagged as outlier, excluded",
+                                   stage="acquisition")
+                return
+            if self.live_ranking:
+                # Coalesced: only the newest signature is ranked
+                weights = result.weights() if self.tester.weight_noisy_pins else None
+                self.live_ranker.submit(result.stats.mean, weights, result.stats.count)
+            sampler = result.sampler
+            if sampler and sampler.best and not sampler.decided:
+                self.update_status(f"Leading: {sampler.best[0]} "
+                                   f"(margin {sampler.score:.2f}, "
+                                   f"need {sampler.threshold:.2f})", stage="acquisition")
+
+        elif kind == acquisition.SYNC:
+            # Partial frames before a cycle boundary are discarded
+            self.current_buffer = []
+            self.ui.set_values([0.0] * 8)
+            self.update_status(f"Frame sync acquired ({payload})", stage="acquisition")
+
+        elif kind == acquisition.READY:
+            self.update_status(f"Device ready ({payload})", stage="acquisition")
+
+        elif kind == acquisition.DISCONNECTED:
+            self.current_buffer = []
+            self.ui.set_values([0.0] * 8)
+            self.update_status(f"Device disconnected ({payload}), reconnecting...", stage="acquisition")
+
+        elif kind == acquisition.SCAN:
+            self.update_status(f"Channel scan received (frame {idx})", stage="acquisition")
+
+        elif kind == acquisition.INVALID:
+            self.update_status(f"Invalid value: {payload}", stage="acquisition")
 
     def compute_average(self):
-        """Compute averaged array"""
-        A = []
-        for col in range(8):
-            col_values = [msg[col] for msg in self.messages]
-            avg_val = sum(col_values) / len(col_values)
-            A.append(avg_val)
+        """Signature from the streaming per-pin statistics"""
+        A = self.pin_stats.mean.tolist()
 
         self.averaged_array = A
-        self.update_status(f"Averaged array: {[f'{v:.3f}' for v in A]}")
-        self.update_visualization()
+        self.update_status(f"Averaged array: {[f'{v:.3f}' for v in A]}", stage="acquisition")
+        self.update_status(f"Pin std dev: {[f'{v:.3f}' for v in self.pin_stats.std]} "
+                           f"({self.pin_stats.count} messages, {self.pin_stats.outliers} outliers)",
+                           stage="acquisition")
+        self.ui.call(self.update_visualization)
 
     def enable_compare_button(self):
         self.compare_btn.config(state=tk.NORMAL)
 
     def stop_collection(self):
         self.collecting = False
+        # Also called from the collection thread, so the buttons change on the next UI tick
+        self.ui.call(self.reset_collection_buttons)
+
+        # Keep the session open and in sync for the next test
+        if self.tester.session:
+            self.tester.session.end_capture()
+
+    def reset_collection_buttons(self):
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
 
-        if self.serial_conn and hasattr(self.serial_conn, 'is_open') and self.serial_conn.is_open:
-            try:
-                self.serial_conn.close()
-                self.update_status("Serial closed")
-            except Exception as e:
-                self.update_status(f"Error closing serial: {e}")
-
-        self.serial_conn = None
+    def close_acquisition(self):
+        self.tester.close()
 
     def compare_with_database(self):
         """Compare measured data with all ICs in MongoDB"""
@@ -507,58 +885,56 @@ class MongoDBICTesterGUI:
             return
 
         try:
-            self.update_status("Comparing with database...")
+            self.update_status("Comparing with database...", stage="matching")
 
-            # Get all ICs from database
-            all_ics = list(self.collection.find({"readings": {"$exists": True}}))
-
-            if not all_ics:
-                messagebox.showwarning("Empty Database", "No ICs in database to compare.")
+            if self.match_mode_var.get() == "Server" and self.store is None:
+                messagebox.showwarning("Offline", "Server-side matching needs a MongoDB connection.")
                 return
 
-            results = []
-
-            for ic_doc in all_ics:
-                ic_name = ic_doc.get("ic_name", "Unknown")
-                ic_readings = ic_doc.get("readings", [])
+            weights = self.pin_stats.weights() if self.pin_stats and self.tester.weight_noisy_pins else None
+            results = self.rank_measurement(self.averaged_array, self.max_results, weights,
+                                            self.match_mode_var.get().lower())
 
-                if len(ic_readings) == 8:
-                    # Calculate SSE
-                    sse = sum((a - b) ** 2 for a, b in zip(self.averaged_array, ic_readings))
-                    results.append((ic_name, sse, ic_readings))
+            if not results:
+                messagebox.showwarning("Empty Database", "No ICs in database to compare.")
+                return
 
-            # Sort by SSE
-            results.sort(key=lambda x: x[1])
             self.comparison_results = results
-
-            # Clear tree
-            self.results_tree.delete(*self.results_tree.get_children())
-
-            # Add to treeview
-            for i, (name, sse, data) in enumerate(results, 1):
-                similarity = 100 / (1 + sse) if sse > 0 else 100
-                self.results_tree.insert("", tk.END, values=(
-                    i, name, f"{sse:.4f}", f"{similarity:.1f}%"
-                ))
+            self.live_ranker.cancel()
+            self.fill_results_tree(results)
 
             if results:
                 best_name, best_sse, _ = results[0]
-                self.update_status(f"Best match: {best_name} (SSE: {best_sse:.4f})")
+                self.update_status(f"Best match: {best_name} (SSE: {best_sse:.4f})", stage="matching")
 
                 # Select best match
                 first_item = self.results_tree.get_children()[0]
                 self.results_tree.selection_set(first_item)
                 self.results_tree.focus(first_item)
 
-                # Show photo
-                threading.Thread(target=self.display_ic_photo, args=(best_name,), daemon=True).start()
+                # Prefetch photos of the top matches, the best one is shown when ready
+                self.start_photo_prefetch([name for name, _, _ in results[:self.prefetch_count]])
 
             self.save_btn.config(state=tk.NORMAL)
 
         except Exception as e:
-            self.update_status(f"Comparison error: {e}")
+            self.update_status(f"Comparison error: {e}", stage="matching")
             messagebox.showerror("Error", str(e))
 
+    def fill_results_tree(self, results):
+        self.results_tree.delete(*self.results_tree.get_children())
+        for i, (name, sse, data) in enumerate(results, 1):
+            similarity = 100 / (1 + sse) if sse > 0 else 100
+            self.results_tree.insert("", tk.END, values=(
+                i, name, f"{sse:.4f}", f"{similarity:.1f}%"
+            ))
+
+    def rank_measurement(self, measured, k, weights=None, match_mode=None):
+        """Top-k matches [(name, sse, readings)]; match_mode defaults to the
+        mode of the current run, since the live ranker calls this off the Tk thread"""
+        # Signatures come from the local cache, later saves/deletes patch the index
+        return self.tester.rank(measured, k, weights, match_mode or self.run_match_mode)
+
     def save_to_database(self):
         """Save measurement results to database"""
         if not self.averaged_array:
@@ -573,36 +949,17 @@ class MongoDBICTesterGUI:
             return
 
         try:
-            # Check if already exists
-            existing = self.collection.find_one({"ic_name": ic_name})
-
-            doc = {
-                "ic_name": ic_name,
-                "readings": self.averaged_array,
-                "timestamp": datetime.now(),
-                "messages": self.messages,
-                "comparison_results": [
-                    {"name": name, "sse": sse}
-                    for name, sse, _ in self.comparison_results[:5]
-                ] if self.comparison_results else []
-            }
-
-            if existing:
-                # Update
-                self.collection.update_one(
-                    {"ic_name": ic_name},
-                    {"$set": doc}
-                )
-                self.update_status(f"Updated IC: {ic_name}")
+            created = self.tester.save(ic_name, self.identification, self.comparison_results)
+
+            if not created:
+                self.update_status(f"Updated IC: {ic_name}", stage="database")
                 messagebox.showinfo("Success", f"Updated IC in database:\n{ic_name}")
             else:
-                # Insert
-                self.collection.insert_one(doc)
-                self.update_status(f"Added IC: {ic_name}")
+                self.update_status(f"Added IC: {ic_name}", stage="database")
                 messagebox.showinfo("Success", f"Added new IC to database:\n{ic_name}")
 
         except Exception as e:
-            self.update_status(f"Save error: {e}")
+            self.update_status(f"Save error: {e}", stage="database")
             messagebox.showerror("Error", str(e))
 
     def add_ic_to_database(self):
@@ -637,6 +994,9 @@ class MongoDBICTesterGUI:
         ttk.Button(dialog, text="Browse", command=browse_photo).grid(row=3, column=1, padx=10, pady=10, sticky=tk.E)
 
         def save_ic():
+            if self.store is None:
+                messagebox.showwarning("Offline", "Adding an IC needs a MongoDB connection.")
+                return
             try:
                 ic_name = name_entry.get().strip()
                 if not ic_name:
@@ -651,6 +1011,19 @@ class MongoDBICTesterGUI:
                     messagebox.showerror("Error", "Must provide exactly 8 readings")
                     return
 
+                # Check the photo before writing anything
+                from ic_store import make_thumbnails
+                photo = None
+                photo_path = photo_path_var.get()
+                if photo_path and os.path.exists(photo_path):
+                    with open(photo_path, "rb") as f:
+                        photo = f.read()
+                    try:
+                        thumbnails = make_thumbnails(photo)
+                    except OSError:
+                        messagebox.showerror("Error", f"Not a readable image: {photo_path}")
+                        return
+
                 doc = {
                     "ic_name": ic_name,
                     "readings": readings,
@@ -658,24 +1031,21 @@ class MongoDBICTesterGUI:
                     "added_manually": True
                 }
 
-                # Add photo if provided
-                photo_path = photo_path_var.get()
-                if photo_path and os.path.exists(photo_path):
-                    with open(photo_path, "rb") as f:
-                        photo_data = f.read()
-                        doc["photo"] = base64.b64encode(photo_data).decode('utf-8')
-
                 # Insert or update
-                existing = self.collection.find_one({"ic_name": ic_name})
-                if existing:
-                    self.collection.update_one({"ic_name": ic_name}, {"$set": doc})
+                created = self.store.save(ic_name, doc)
+                self.signature_index.upsert(ic_name, readings)
+
+                # Add photo if provided (GridFS, with pre-sized thumbnails)
+                if photo is not None:
+                    self.store.put_photo(ic_name, photo, thumbnails)
+                self.photo_cache.invalidate(ic_name)
+                if not created:
                     messagebox.showinfo("Success", f"Updated IC: {ic_name}")
                 else:
-                    self.collection.insert_one(doc)
                     messagebox.showinfo("Success", f"Added IC: {ic_name}")
 
                 dialog.destroy()
-                self.update_status(f"IC added: {ic_name}")
+                self.update_status(f"IC added: {ic_name}", stage="database")
 
             except Exception as e:
                 messagebox.showerror("Error", str(e))
@@ -684,75 +1054,99 @@ class MongoDBICTesterGUI:
             row=4, column=0, columnspan=2, pady=20)
 
     def view_database(self):
-        """View all ICs in database"""
+        """Browse the database a page at a time"""
+        if self.store is None:
+            messagebox.showwarning("Offline", "Viewing the database needs a MongoDB connection.")
+            return
+        from db_viewer import DatabaseViewer
+        DatabaseViewer(self.root, self.store, self.ui.call, on_delete=self.delete_ic)
+
+    def import_library(self):
+        """Bulk-import reference signatures from a CSV, JSON-lines or NPZ file"""
+        if self.store is None:
+            messagebox.showwarning("Offline", "Importing needs a MongoDB connection.")
+            return
+        path = filedialog.askopenfilename(
+            title="Import Signature Library",
+            filetypes=[("Signature libraries", "*.csv *.jsonl *.json *.npz"), ("All files", "*.*")])
+        if path:
+            threading.Thread(target=self.run_library_import,
+                             args=(path, self.db_name_var.get(), self.collection_name_var.get()),
+                             daemon=True).start()
+
+    def run_library_import(self, path, db_name, collection_name):
+        import library_io
+
+        def progress(stats):
+            self.update_status(f"Importing: {stats['rows']} rows read, {len(stats['errors'])} errors",
+                               stage="database")
+
         try:
-            all_ics = list(self.collection.find())
+            self.update_status(f"Importing {os.path.basename(path)}...", stage="database")
+            stats = library_io.import_library(self.store, path, progress=progress)
+            # Imported rows get a fresh server modified_at, so the delta sync finds them
+            self.sync_signature_cache(db_name, collection_name)
+
+            rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            summary = (f"{stats['rows']} rows in {stats['seconds']:.1f} s ({rate:.0f} rows/s): "
+                       f"{stats['created']} created, {stats['updated']} updated, "
+                       f"{len(stats['errors'])} errors")
+            self.update_status(f"Imported {summary}", stage="database")
+            for row, message in stats["errors"]:
+                self.log_message(f"Import row {row}: {message}", stage="database")
+            self.ui.call(messagebox.showinfo, "Import Complete",
+                         f"Imported {summary}" + ("\nSee the Log tab for the rejected rows."
+                                                  if stats["errors"] else ""))
+        except Exception as e:
+            self.update_status(f"Import error: {e}", stage="database")
+            self.ui.call(messagebox.showerror, "Import Error", str(e))
 
-            if not all_ics:
-                messagebox.showinfo("Database", "Database is empty")
-                return
+    def export_library(self):
+        """Export every reference signature to a CSV, JSON-lines or NPZ file"""
+        if self.store is None:
+            messagebox.showwarning("Offline", "Exporting needs a MongoDB connection.")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Export Signature Library", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON lines", "*.jsonl"), ("NumPy archive", "*.npz")])
+        if path:
+            threading.Thread(target=self.run_library_export, args=(path,), daemon=True).start()
 
-            # Create view window
-            view_window = tk.Toplevel(self.root)
-            view_window.title("Database Viewer")
-            view_window.geometry("800x600")
-
-            # Create treeview
-            columns = ("IC Name", "Readings", "Timestamp", "Has Photo")
-            tree = ttk.Treeview(view_window, columns=columns, show="headings")
-
-            for col in columns:
-                tree.heading(col, text=col)
-                if col == "IC Name":
-                    tree.column(col, width=200)
-                elif col == "Readings":
-                    tree.column(col, width=300)
-                else:
-                    tree.column(col, width=150)
-
-            # Add data
-            for ic in all_ics:
-                name = ic.get("ic_name", "Unknown")
-                readings = ic.get("readings", [])
-                readings_str = ", ".join([f"{r:.2f}" for r in readings]) if readings else "N/A"
-                timestamp = ic.get("timestamp", "N/A")
-                if isinstance(timestamp, datetime):
-                    timestamp = timestamp.strftime("%Y-%m-%d %H:%M")
-                has_photo = "Yes" if "photo" in ic else "No"
-
-                tree.insert("", tk.END, values=(name, readings_str, timestamp, has_photo))
-
-            # Scrollbars
-            vsb = ttk.Scrollbar(view_window, orient="vertical", command=tree.yview)
-            hsb = ttk.Scrollbar(view_window, orient="horizontal", command=tree.xview)
-            tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-            tree.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-            vsb.grid(row=0, column=1, sticky=(tk.N, tk.S))
-            hsb.grid(row=1, column=0, sticky=(tk.E, tk.W))
-
-            view_window.columnconfigure(0, weight=1)
-            view_window.rowconfigure(0, weight=1)
-
-            # Delete button
-            def delete_selected():
-                selection = tree.selection()
-                if selection:
-                    item = tree.item(selection[0])
-                    ic_name = item['values'][0]
-                    if messagebox.askyesno("Confirm Delete", f"Delete IC: {ic_name}?"):
-                        self.collection.delete_one({"ic_name": ic_name})
-                        tree.delete(selection[0])
-                        self.update_status(f"Deleted IC: {ic_name}")
-
-            ttk.Button(view_window, text="Delete Selected", command=delete_selected).grid(
-                row=2, column=0, columnspan=2, pady=10)
+    def run_library_export(self, path):
+        import library_io
+
+        try:
+            self.update_status(f"Exporting to {os.path.basename(path)}...", stage="database")
+            stats = library_io.export_library(
+                self.store, path,
+                progress=lambda rows: self.update_status(f"Exporting: {rows} rows written", stage="database"))
+            self.update_status(f"Exported {stats['rows']} ICs in {stats['seconds']:.1f} s", stage="database")
+            self.ui.call(messagebox.showinfo, "Export Complete",
+                         f"Exported {stats['rows']} ICs to\n{path}")
+        except Exception as e:
+            self.update_status(f"Export error: {e}", stage="database")
+            self.ui.call(messagebox.showerror, "Export Error", str(e))
 
+    def delete_ic(self, ic_name):
+        """Delete an IC; returns True once it is gone from the database"""
+        try:
+            if self.store is None:
+                raise RuntimeError("Not connected to MongoDB")
+            deleted = self.store.delete(ic_name)
+            self.signature_index.remove(ic_name)
+            self.photo_cache.invalidate(ic_name)
+            self.update_status(f"Deleted IC: {ic_name}" if deleted
+                               else f"IC {ic_name} was already deleted", stage="database")
+            return True
         except Exception as e:
+            self.update_status(f"Delete failed for {ic_name}: {e}", stage="database")
             messagebox.showerror("Error", str(e))
+            return False
 
     def update_visualization(self):
         """Update matplotlib visualization"""
+        self.build_plots()
+        self.live_plot.stop()
         self.ax1.clear()
         self.ax2.clear()
 
@@ -790,8 +1184,13 @@ class MongoDBICTesterGUI:
     def on_closing(self):
         """Clean up on window close"""
         self.stop_collection()
+        self.close_acquisition()
+        self.live_ranker.shutdown()
+        self.photo_prefetcher.shutdown()
+        self.signature_index.close()
         if self.mongo_client:
             self.mongo_client.close()
+        self.event_log.close()
         self.root.destroy()
 
 
@@ -0,0 +1,463 @@
+"""Event-driven serial acquisition.
+
+A reader thread does blocking, chunked reads from the port into a receive
+buffer, splits complete lines in bulk and groups the parsed values into
+8-pin frames. Everything is handed to consumers as events on a bounded
+queue: when the consumer falls behind, the reader blocks for up to
+put_timeout (backpressure) and only then drops events, which are counted.
+
+Frames are aligned by FrameSynchronizer: values are only assembled after a
+cycle boundary has been seen (the firmware's "#SYNC" line, its start-up
+banner, or an idle gap), so opening the port mid-cycle or a corrupted line
+no longer shifts every later pin.
+
+With protocol="auto" the engine asks the firmware for the binary framed
+protocol (see wire_protocol.py) and stays on ASCII lines if no
+acknowledgement or valid frame arrives within negotiate_timeout.
+"""
+import queue
+import threading
+import time
+
+import serial
+
+from signature_index import NUM_PINS
+from wire_protocol import (ACK_ASCII, ACK_BINARY, ADC_FULL_SCALE, DEFAULT_VREF,
+                           REQUEST_ASCII, REQUEST_BINARY, BinaryFrameDecoder)
+
+
+# Event kinds placed on AcquisitionEngine.events
+VALUE = "value"        # (VALUE, pin_index, value)
+FRAME = "frame"        # (FRAME, None, [8 values])
+INVALID = "invalid"    # (INVALID, None, raw line)
+SYNC = "sync"          # (SYNC, None, reason) frame boundary found after a loss of sync
+SCAN = "scan"          # (SCAN, seq, 8x8 array) full channel scan (binary protocol only)
+ERROR = "error"        # (ERROR, None, exception)
+READY = "ready"        # (READY, None, reason) device answered after (re)opening the port
+DISCONNECTED = "disconnected"  # (DISCONNECTED, None, exception) port lost, reconnecting
+
+# Queued even between captures
+STATUS_KINDS = (READY, DISCONNECTED, ERROR)
+
+SYNC_MARKER = "#SYNC"
+READY_BANNER = "Arduino Ready"
+
+READ_CHUNK = 4096
+
+
+class LineParser:
+    """Splits a byte stream into lines and parses them as floats"""
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    def reset(self):
+        self._pending = bytearray()
+
+    def feed(self, data):
+        """Return [(value, raw)] for the complete lines in data, in order.
+
+        value is None for lines that are not a number.
+        """
+        self._pending += data
+        end = self._pending.rfind(b"\n")
+        if end < 0:
+            return []
+        lines = self._pending[:end].split(b"\n")
+        del self._pending[:end + 1]
+
+        parsed = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                parsed.append((float(line), None))
+            except ValueError:
+                parsed.append((None, line.decode("utf-8", errors="replace")))
+        return parsed
+
+
+class FrameSynchronizer:
+    """Assembles values into frames that start on a detected cycle boundary.
+
+    Boundaries are the sync marker line, the firmware banner, or (when
+    gap_threshold is set) a value arriving after an idle gap longer than
+    gap_threshold seconds; the ATmega pauses ~0.5 s between cycles on top
+    of the ~0.57 s between pins. A corrupted line still occupies its pin
+    slot, so alignment is kept: the frame is dropped, or with repair=True
+    the pin is filled from the last good frame. Values before the first
+    boundary, and surplus values after a full frame, are discarded until
+    the next boundary. If no boundary shows up within fallback_frames
+    frames' worth of values, the stream is taken as positional (legacy
+    firmware without marker or gaps).
+    """
+
+    def __init__(self, num_pins=NUM_PINS, gap_threshold=0.8, sync_marker=SYNC_MARKER,
+                 banners=(READY_BANNER,), repair=False, fallback_frames=3):
+        self.num_pins = num_pins
+        self.gap_threshold = gap_threshold
+        self.sync_marker = sync_marker
+        self.banners = tuple(banners)
+        self.repair = repair
+        self.fallback_values = fallback_frames * num_pins
+        self.stats = {"frames": 0, "resyncs": 0, "discarded_values": 0,
+                      "dropped_frames": 0, "repaired_frames": 0}
+        self.synced = False
+        self.positional = False
+        self._awaiting_boundary = False
+        self._slots = []
+        self._last_good = None
+        self._last_time = None
+        self._unsynced_values = 0
+
+    def reset(self):
+        """Require a fresh boundary before the next frame"""
+        self.stats["discarded_values"] += len(self._slots)
+        self._slots = []
+        self.synced = False
+        self.positional = False
+        self._awaiting_boundary = False
+        self._unsynced_values = 0
+        self._last_time = None
+
+    def restart_frame(self):
+        """Drop the frame in progress and start again at the next boundary"""
+        if self.positional:
+            # Without boundaries alignment is only known by counting
+            return
+        self.stats["discarded_values"] += len(self._slots)
+        self._slots = []
+        self._awaiting_boundary = self.synced
+
+    def _lose_sync(self):
+        self.stats["discarded_values"] += len(self._slots)
+        self._slots = []
+        self.synced = False
+        self._awaiting_boundary = False
+        self._unsynced_values = 0
+
+    def _boundary(self, reason):
+        if self._slots:
+            # A frame cut short by the next cycle
+            self.stats["dropped_frames"] += 1
+            self.stats["discarded_values"] += len(self._slots)
+            self._slots = []
+        self.positional = False
+        self._awaiting_boundary = False
+        if self.synced:
+            return []
+        self.synced = True
+        self._unsynced_values = 0
+        self.stats["resyncs"] += 1
+        return [(SYNC, None, reason)]
+
+    def feed(self, value, raw, now):
+        """Process one parsed line (value None if it was not a number)"""
+        events = []
+        gap = None if self._last_time is None else now - self._last_time
+        self._last_time = now
+
+        if value is None:
+            text = raw.strip()
+            if text == self.sync_marker:
+                return self._boundary("marker")
+            if text in self.banners:
+                return self._boundary("banner")
+
+        if self.gap_threshold is not None and gap is not None and gap >= self.gap_threshold:
+            events.extend(self._boundary("gap"))
+        if value is None:
+            events.append((INVALID, None, raw))
+
+        if self._awaiting_boundary:
+            # More lines than pins in this cycle: alignment is unknown
+            self._lose_sync()
+
+        if not self.synced:
+            if value is None:
+                return events
+            self._unsynced_values += 1
+            if self._unsynced_values <= self.fallback_values:
+                self.stats["discarded_values"] += 1
+                return events
+            events.extend(self._boundary("fallback"))
+            self.positional = True
+
+        if value is not None:
+            events.append((VALUE, len(self._slots), value))
+        # A corrupted line still takes its pin slot
+        self._slots.append(value)
+
+        if len(self._slots) == self.num_pins:
+            events.extend(self._complete())
+        return events
+
+    def _complete(self):
+        slots, self._slots = self._slots, []
+        self._awaiting_boundary = not self.positional
+
+        missing = [i for i, v in enumerate(slots) if v is None]
+        if missing:
+            if not self.repair or self._last_good is None:
+                self.stats["dropped_frames"] += 1
+                return []
+            for i in missing:
+                slots[i] = self._last_good[i]
+            self.stats["repaired_frames"] += 1
+
+        self._last_good = slots
+        self.stats["frames"] += 1
+        return [(FRAME, None, slots)]
+
+
+class AcquisitionEngine:
+    """Long-lived serial session that reads the tester's stream on a thread.
+
+    The port stays open between tests: end_capture() only stops events
+    from being queued, while the reader keeps the link synchronised, and
+    begin_capture() starts the next test at the next frame boundary. After
+    (re)opening, the device counts as ready on its banner or first data,
+    or after ready_timeout for silent firmware. If the device is unplugged
+    the session reopens it every reconnect_interval seconds.
+    """
+
+    def __init__(self, port, baudrate, num_pins=NUM_PINS, queue_size=1024,
+                 put_timeout=1.0, read_timeout=0.1, ready_timeout=2.0, framing=None,
+                 protocol="auto", negotiate_timeout=8.0, vref=DEFAULT_VREF,
+                 reconnect_interval=1.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.num_pins = num_pins
+        self.put_timeout = put_timeout
+        self.read_timeout = read_timeout
+        self.ready_timeout = ready_timeout
+        self.reconnect_interval = reconnect_interval
+        self.events = queue.Queue(maxsize=queue_size)
+        self.stats = {"bytes": 0, "values": 0, "invalid": 0, "dropped": 0, "reconnects": 0}
+        self.serial_conn = None
+        self.capturing = False
+        self.framer = FrameSynchronizer(num_pins, **(framing or {}))
+        # "ascii", "binary" or "auto"; mode is what the link actually uses
+        self.protocol = protocol
+        self.negotiate_timeout = negotiate_timeout
+        self._running = threading.Event()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        # Set by begin_capture(); the reader restarts the frame and starts
+        # capturing, since only the reader thread touches the framer
+        self._begin = threading.Event()
+        self._thread = None
+        self._parser = LineParser()
+        self._binary = BinaryFrameDecoder(scale=vref / ADC_FULL_SCALE)
+        self._reset_link()
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def settings(self):
+        return (self.port, self.baudrate, self.protocol)
+
+    def start(self):
+        """Open the port (a device name or a pyserial URL), start the reader
+        thread and begin capturing"""
+        self._open()
+        self.capturing = True
+        self._wake.clear()
+        self._running.set()
+        self._thread = threading.Thread(target=self._read_loop, name="serial-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Close the session"""
+        self._running.clear()
+        self._wake.set()
+        self.capturing = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2 * self.read_timeout + self.put_timeout)
+        self._thread = None
+        self._close()
+
+    def begin_capture(self):
+        """Queue events again, starting with the next complete frame"""
+        while self.get(timeout=0) is not None:
+            pass
+        if self.running:
+            self._begin.set()
+        else:
+            self.framer.restart_frame()
+            self.capturing = True
+
+    def end_capture(self):
+        """Stop queueing events; the port stays open and in sync"""
+        self._begin.clear()
+        self.capturing = False
+
+    def _start_capture(self):
+        """Reader thread: apply a pending begin_capture()"""
+        if self._begin.is_set():
+            self._begin.clear()
+            self.framer.restart_frame()
+            self.capturing = True
+
+    def _reset_link(self):
+        self.mode = None
+        self._negotiate_deadline = None
+        self._ready_deadline = None
+        self._ready.clear()
+        self._parser.reset()
+        self._binary.reset()
+        self.framer.reset()
+
+    def _open(self):
+        self._reset_link()
+        self.serial_conn = serial.serial_for_url(self.port, baudrate=self.baudrate,
+                                                 timeout=self.read_timeout)
+        # Opening the port may reset an Arduino; wait for it to speak first
+        self._ready_deadline = time.monotonic() + self.ready_timeout
+
+    def _close(self):
+        if self.serial_conn and self.serial_conn.is_open:
+            try:
+                self.serial_conn.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.serial_conn = None
+        self._ready.clear()
+
+    def _set_ready(self, reason):
+        if self._ready.is_set():
+            return
+        self._ready.set()
+        self._negotiate()
+        self._emit((READY, None, reason))
+
+    def _negotiate(self):
+        if self.protocol == "ascii":
+            self.mode = "ascii"
+            self.serial_conn.write(REQUEST_ASCII)
+            return
+        if self.protocol == "binary":
+            self.mode = "binary"
+        self.serial_conn.write(REQUEST_BINARY)
+        self._negotiate_deadline = time.monotonic() + self.negotiate_timeout
+
+    def _set_mode(self, mode, reason):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        if mode == "binary":
+            # Binary frames are self-delimiting; drop any partial ASCII frame
+            self.framer.reset()
+            self._emit((SYNC, None, reason))
+
+    def link_stats(self):
+        """Counters for link quality monitoring"""
+        stats = {**self.stats, **self.framer.stats, **self._binary.stats}
+        stats["frames"] += stats["binary_frames"]
+        stats["dropped_frames"] += stats["lost_frames"]
+        stats["protocol"] = self.mode or "negotiating"
+        return stats
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _emit(self, event):
+        if not self.capturing and event[0] not in STATUS_KINDS:
+            return
+        try:
+            self.events.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _read_loop(self):
+        try:
+            while self._running.is_set():
+                try:
+                    if self.serial_conn is None:
+                        self._open()
+                        self.stats["reconnects"] += 1
+                    self._read_until_closed()
+                except (serial.SerialException, OSError) as e:
+                    if not self._running.is_set():
+                        break
+                    if self.serial_conn is not None:
+                        self._close()
+                        self._emit((DISCONNECTED, None, e))
+                    self._wake.wait(self.reconnect_interval)
+        except Exception as e:
+            if self._running.is_set():
+                self._emit((ERROR, None, e))
+        finally:
+            self._running.clear()
+
+    def _read_until_closed(self):
+        while self._running.is_set():
+            self._start_capture()
+            # Blocks for up to read_timeout waiting for the first byte,
+            # then takes everything already buffered in one call
+            data = self.serial_conn.read(min(max(self.serial_conn.in_waiting, 1), READ_CHUNK))
+            if data:
+                self.stats["bytes"] += len(data)
+                self._process(data)
+            now = time.monotonic()
+            if not self._ready.is_set() and now >= self._ready_deadline:
+                self._set_ready("timeout")
+            if self.mode is None and self._negotiate_deadline is not None \
+                    and now >= self._negotiate_deadline:
+                self.mode = "ascii"
+
+    def _process(self, data):
+        now = time.monotonic()
+        # In auto mode the decoder keeps watching after an ASCII fallback,
+        # since the firmware only answers between measurement cycles
+        if self.protocol != "ascii":
+            frames = self._binary.feed(data)
+            if frames:
+                self._set_ready("data")
+                self._set_mode("binary", "binary frame")
+                for seq, values in frames:
+                    self._emit_binary(seq, values)
+        if self.mode == "binary":
+            return
+
+        for value, raw in self._parser.feed(data):
+            if value is None:
+                text = raw.strip()
+                if text == ACK_BINARY:
+                    # The rest of the stream is framed; the decoder already has it
+                    self._set_mode("binary", "binary acknowledged")
+                    return
+                if text == ACK_ASCII:
+                    self.mode = "ascii"
+                    continue
+                if text in self.framer.banners:
+                    self._set_ready("banner")
+            else:
+                self._set_ready("data")
+                self.stats["values"] += 1
+            for event in self.framer.feed(value, raw, now):
+                if event[0] == INVALID:
+                    self.stats["invalid"] += 1
+                self._emit(event)
+
+    def _emit_binary(self, seq, values):
+        if len(values) == self.num_pins:
+            self.stats["values"] += self.num_pins
+            for i, value in enumerate(values.tolist()):
+                self._emit((VALUE, i, value))
+            self._emit((FRAME, None, values.tolist()))
+        elif len(values) == self.num_pins * self.num_pins:
+            self._emit((SCAN, seq, values.reshape(self.num_pins, self.num_pins)))
+        else:
+            self.stats["invalid"] += 1
+            self._emit((INVALID, None, f"binary frame {seq} with {len(values)} channels"))
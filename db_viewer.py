@@ -0,0 +1,193 @@
+import threading
+import tkinter as tk
+from datetime import datetime
+from tkinter import ttk, messagebox
+
+from ic_store import LISTING_PAGE_SIZE
+from signature_codec import decode_list
+
+
+# Label -> (indexed field, descending)
+SORT_OPTIONS = {
+    "Name (A-Z)": ("ic_name", False),
+    "Name (Z-A)": ("ic_name", True),
+    "Newest first": ("timestamp", True),
+    "Oldest first": ("timestamp", False),
+}
+
+
+class DatabaseViewer:
+    """Database window that pages through the collection on demand.
+
+    Pages come from ICStore.listing_page on a worker thread: the first one
+    when the window opens, the next whenever the list is scrolled near its
+    end, so opening costs one page however large the collection is. Search
+    and sort run on the server and restart from the first page; pages
+    still in flight for an older query are dropped. post(fn, *args) must
+    run fn on the Tk thread; on_delete(ic_name) returns True if the IC was
+    deleted, and only then is its row removed.
+    """
+
+    def __init__(self, parent, store, post, on_delete=None, page_size=LISTING_PAGE_SIZE,
+                 search_delay=300):
+        self.store = store
+        self.post = post
+        self.on_delete = on_delete
+        self.page_size = page_size
+        self.search_delay = search_delay
+        self.total = None
+        self._generation = 0
+        self._loading = False
+        self._exhausted = False
+        self._after = None
+        self._search_job = None
+        self._names = {}
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("Database Viewer")
+        self.window.geometry("800x600")
+
+        # Search and sort
+        controls = ttk.Frame(self.window, padding=(5, 5))
+        controls.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        controls.columnconfigure(1, weight=1)
+
+        ttk.Label(controls, text="Search:").grid(row=0, column=0, padx=(0, 5))
+        self.search_var = tk.StringVar()
+        ttk.Entry(controls, textvariable=self.search_var).grid(row=0, column=1, sticky=(tk.W, tk.E))
+        self.regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Regex", variable=self.regex_var,
+                        command=self.restart).grid(row=0, column=2, padx=5)
+        ttk.Label(controls, text="Sort:").grid(row=0, column=3, padx=(10, 5))
+        self.sort_var = tk.StringVar(value="Name (A-Z)")
+        sort_combo = ttk.Combobox(controls, textvariable=self.sort_var, values=list(SORT_OPTIONS),
+                                  state="readonly", width=14)
+        sort_combo.grid(row=0, column=4)
+        sort_combo.bind("<<ComboboxSelected>>", lambda event: self.restart())
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+
+        # Create treeview
+        columns = ("IC Name", "Readings", "Timestamp", "Has Photo")
+        self.tree = ttk.Treeview(self.window, columns=columns, show="headings")
+
+        for col in columns:
+            self.tree.heading(col, text=col)
+            if col == "IC Name":
+                self.tree.column(col, width=200)
+            elif col == "Readings":
+                self.tree.column(col, width=300)
+            else:
+                self.tree.column(col, width=150)
+
+        # Scrollbars; scrolling near the end loads the next page
+        self.vsb = ttk.Scrollbar(self.window, orient="vertical", command=self.tree.yview)
+        hsb = ttk.Scrollbar(self.window, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(yscrollcommand=self.on_scroll, xscrollcommand=hsb.set)
+
+        self.tree.grid(row=1, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        self.vsb.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        hsb.grid(row=2, column=0, sticky=(tk.E, tk.W))
+
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        bottom = ttk.Frame(self.window, padding=(5, 5))
+        bottom.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        bottom.columnconfigure(0, weight=1)
+        self.status_var = tk.StringVar(value="Loading...")
+        ttk.Label(bottom, textvariable=self.status_var).grid(row=0, column=0, sticky=tk.W)
+        ttk.Button(bottom, text="Delete Selected", command=self.delete_selected).grid(row=0, column=1)
+
+        self.load_more()
+
+    def query(self):
+        sort, descending = SORT_OPTIONS[self.sort_var.get()]
+        return sort, descending, self.search_var.get().strip(), self.regex_var.get()
+
+    def schedule_search(self):
+        """Restart after a pause in typing, not on every key"""
+        if self._search_job is not None:
+            self.window.after_cancel(self._search_job)
+        self._search_job = self.window.after(self.search_delay, self.restart)
+
+    def restart(self):
+        self._search_job = None
+        self._generation += 1
+        self._loading = False
+        self._exhausted = False
+        self._after = None
+        self._names = {}
+        self.tree.delete(*self.tree.get_children())
+        self.status_var.set("Loading...")
+        self.load_more()
+
+    def on_scroll(self, first, last):
+        self.vsb.set(first, last)
+        if float(last) > 0.9:
+            self.load_more()
+
+    def load_more(self):
+        if self._loading or self._exhausted:
+            return
+        self._loading = True
+        threading.Thread(target=self._fetch, args=(self._generation, self.query(), self._after),
+                         daemon=True).start()
+
+    def _fetch(self, generation, query, after):
+        sort, descending, search, regex = query
+        try:
+            if self.total is None:
+                self.total = self.store.count()
+            page = self.store.listing_page(sort, descending, after, search, regex, self.page_size)
+            error = None
+        except Exception as e:
+            page, error = [], e
+        self.post(self._show_page, generation, sort, page, error)
+
+    def _show_page(self, generation, sort, page, error):
+        if generation != self._generation or not self.window.winfo_exists():
+            return
+        self._loading = False
+        if error is not None:
+            self._exhausted = True
+            self.status_var.set(f"Error: {error}")
+            return
+
+        for ic in page:
+            name = ic.get("ic_name", "Unknown")
+            readings = decode_list(ic.get("readings", []))
+            readings_str = ", ".join([f"{r:.2f}" for r in readings]) if readings else "N/A"
+            timestamp = ic.get("timestamp", "N/A")
+            if isinstance(timestamp, datetime):
+                timestamp = timestamp.strftime("%Y-%m-%d %H:%M")
+            has_photo = "Yes" if ic.get("has_photo") else "No"
+
+            iid = str(ic["_id"])
+            self._names[iid] = name
+            self.tree.insert("", tk.END, iid=iid, values=(name, readings_str, timestamp, has_photo))
+
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            self._after = (page[-1].get(sort), page[-1]["_id"])
+
+        shown = len(self._names)
+        if not shown:
+            self.status_var.set("No ICs found")
+        elif self._exhausted:
+            self.status_var.set(f"{shown} ICs")
+        else:
+            total = f" of ~{self.total}" if self.total is not None and not self.query()[2] else ""
+            self.status_var.set(f"Showing {shown}{total} ICs, scroll for more")
+
+    def delete_selected(self):
+        selection = self.tree.selection()
+        if selection:
+            # Names are kept as strings; Treeview values would turn "555" into 555
+            ic_name = self._names[selection[0]]
+            if messagebox.askyesno("Confirm Delete", f"Delete IC: {ic_name}?", parent=self.window):
+                # Keep the row when the delete failed
+                if self.on_delete and not self.on_delete(ic_name):
+                    return
+                self.tree.delete(selection[0])
+                del self._names[selection[0]]
@@ -0,0 +1,103 @@
+"""Bounded in-memory log with an asynchronous rotating log file.
+
+EventLog keeps the newest max_lines display lines in a ring buffer for the
+log view, so memory and per-line cost stay constant however long the app
+runs. Every line is also handed to a logging QueueListener thread, which
+writes the full history as JSON lines to a size-rotated file:
+
+    {"timestamp": "...", "station": "...", "stage": "...", "level": "INFO", "message": "..."}
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import platform
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".ic_tester", "logs")
+LOG_FILE_NAME = "ic_tester.log"
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "station": getattr(record, "station", None),
+            "stage": getattr(record, "stage", None),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        })
+
+
+class EventLog:
+    """Ring buffer of display lines plus a rotating structured log file.
+
+    Pass log_dir=None to keep the log in memory only.
+    """
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, station=None, max_lines=5000,
+                 max_bytes=5 * 1024 * 1024, backup_count=5):
+        self.station = station or platform.node() or "station"
+        self.path = None
+        self._lines = deque(maxlen=max_lines)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._handler = None
+        self._file_handler = None
+
+        self._logger = logging.getLogger(f"ic_tester.events.{id(self)}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if log_dir:
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                self.path = os.path.join(log_dir, LOG_FILE_NAME)
+                self._file_handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            except OSError:
+                self.path = None
+            else:
+                self._file_handler.setFormatter(JsonLineFormatter())
+                # File writes happen on the listener thread, never on the caller's
+                records = queue.SimpleQueue()
+                self._handler = logging.handlers.QueueHandler(records)
+                self._logger.addHandler(self._handler)
+                self._listener = logging.handlers.QueueListener(records, self._file_handler)
+                self._listener.start()
+
+    def write(self, message, stage="gui", level=logging.INFO):
+        """Record one line; safe from any thread"""
+        line = f"[{time.strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            self._seq += 1
+            self._lines.append(line)
+        if self._handler is not None:
+            self._logger.log(level, message, extra={"station": self.station, "stage": stage})
+
+    def lines_since(self, seq):
+        """Return (newest seq, lines after seq, lines that fell out of the buffer)"""
+        with self._lock:
+            new = self._seq - seq
+            available = min(new, len(self._lines))
+            lines = list(itertools.islice(reversed(self._lines), available))
+            lines.reverse()
+            return self._seq, lines, new - available
+
+    def close(self):
+        """Flush pending lines to disk and close the file"""
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler = None
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._file_handler is not None:
+            self._file_handler.close()
+            self._file_handler = None
@@ -0,0 +1,144 @@
+"""Headless IC identification.
+
+Runs N identifications back-to-back on each serial port and streams one
+result per test to stdout (or --output) as JSON lines or CSV. Several
+--port options run the fixtures concurrently, sharing one signature index
+and one MongoDB client. Signatures come from the local signature cache,
+delta-synced from MongoDB when --uri is given.
+
+Usage:
+    python ic_cli.py --port COM3 --count 100
+    python ic_cli.py --port /dev/ttyUSB0 --uri "mongodb+srv://..." --format csv -o runs.csv
+    python ic_cli.py --port COM3 --port COM4 --port COM5 --count 50
+"""
+import argparse
+import csv
+import json
+import sys
+import threading
+
+from nn_index import create_signature_index
+from stations import StationManager
+
+
+CSV_FIELDS = ["station", "n", "timestamp", "best", "sse", "runner_up", "runner_up_sse",
+              "messages", "outliers", "reason", "duration_s"]
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        with self.lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+
+
+class CsvWriter:
+    def __init__(self, stream, num_pins=8):
+        self.stream = stream
+        self.pins = [f"pin{i + 1}" for i in range(num_pins)]
+        self.writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS + self.pins, extrasaction="ignore")
+        self.writer.writeheader()
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        row = dict(record)
+        row.update(zip(self.pins, record["signature"] or []))
+        with self.lock:
+            self.writer.writerow(row)
+            self.stream.flush()
+
+
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identify ICs without the GUI")
+    parser.add_argument("--port", required=True, action="append",
+                        help="Serial port of a tester (repeat for several fixtures)")
+    parser.add_argument("--baud", type=int, default=9600, help="Baud rate")
+    parser.add_argument("--protocol", default="auto", choices=["auto", "ascii", "binary"],
+                        help="Wire protocol")
+    parser.add_argument("--count", type=int, default=1, help="Identifications to run per port")
+    parser.add_argument("--format", default="jsonl", choices=sorted(WRITERS), help="Output format")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--uri", help="MongoDB connection string (default: local cache only)")
+    parser.add_argument("--db", default="ic_tester", help="Database name")
+    parser.add_argument("--collection", default="ic_database", help="Collection name")
+    parser.add_argument("--match", default="local", choices=["local", "server"],
+                        help="Rank in memory or with a MongoDB aggregation")
+    parser.add_argument("--backend", default="brute", choices=["brute", "kdtree", "sharded"],
+                        help="Local index backend")
+    parser.add_argument("--top", type=int, default=10, help="Matches reported per test")
+    parser.add_argument("--fixed", type=int, metavar="N",
+                        help="Collect exactly N messages instead of stopping adaptively")
+    parser.add_argument("--min", type=int, default=1, dest="min_messages",
+                        help="Adaptive mode: minimum messages")
+    parser.add_argument("--max", type=int, default=10, dest="max_messages",
+                        help="Adaptive mode: maximum messages")
+    parser.add_argument("--confidence", type=float, default=0.99,
+                        help="Adaptive mode: confidence for stopping early")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress to stderr")
+    args = parser.parse_args(argv)
+
+    def log(message, stage="engine"):
+        if args.verbose:
+            print(f"[{stage}] {message}", file=sys.stderr, flush=True)
+
+    client = None
+    store = None
+    if args.uri:
+        # Only needed with a URI: the client and ICStore (gridfs, PIL). bson
+        # is loaded either way, through signature_index -> signature_codec
+        import pymongo
+        from ic_store import ICStore
+        client = pymongo.MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+        store = ICStore(client[args.db][args.collection])
+    elif args.match == "server":
+        parser.error("--match server needs --uri")
+
+    manager = StationManager(create_signature_index(args.backend), store=store, log=log,
+                             match_mode=args.match, max_results=args.top,
+                             adaptive=args.fixed is None, fixed_messages=args.fixed or 5,
+                             min_messages=args.min_messages, max_messages=args.max_messages,
+                             confidence=args.confidence)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.match == "local":
+            manager.load_signatures(args.db, args.collection)
+            if len(manager.signature_index) == 0:
+                log("No signatures available; results will have no matches")
+        writer = WRITERS[args.format](output)
+
+        def write_result(station, result):
+            writer.write({"station": station.name, **result.to_record(station.tests)})
+
+        for port in args.port:
+            manager.add_station(port, args.baud, args.protocol)
+        manager.start(args.count, on_result=write_result)
+        # Short waits keep Ctrl+C responsive
+        while not manager.wait(timeout=0.5):
+            pass
+        failed = [s for s in manager.status() if s["error"]]
+        for status in failed:
+            print(f"{status['name']}: {status['error']}", file=sys.stderr)
+        return 1 if failed else 0
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        manager.close()
+        manager.signature_index.close()
+        if output is not sys.stdout:
+            output.close()
+        if client:
+            client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
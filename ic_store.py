@@ -0,0 +1,413 @@
+import base64
+import io
+import re
+from datetime import timedelta
+
+import gridfs
+from PIL import Image
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from signature_codec import compact_fields, decode_list
+
+
+# Projections per use case, so large fields only travel when asked for
+SIGNATURE_PROJECTION = {"ic_name": 1, "readings": 1, "timestamp": 1}
+PHOTO_PROJECTION = {"_id": 0, "ic_name": 1, "photo": 1, "photo_id": 1, "thumbnails": 1}
+PHOTO_FILES_PROJECTION = {"_id": 0, "photo_id": 1, "thumbnails": 1}
+ID_PROJECTION = {"_id": 1}
+
+# Server-side ($currentDate) stamps used for delta sync; every write through
+# ICStore sets modified_at and every delete leaves a tombstone
+MODIFIED_FIELD = "modified_at"
+DELETED_FIELD = "deleted_at"
+TOMBSTONE_SUFFIX = "_deleted"
+# Tombstones expire (TTL index) after this long; a cache that has not
+# synced for longer must reload in full
+TOMBSTONE_TTL = timedelta(days=30)
+
+# Signature documents are a few hundred bytes, so large batches keep
+# round trips low without approaching the 16 MB reply limit
+SIGNATURE_BATCH_SIZE = 5000
+LISTING_BATCH_SIZE = 1000
+LISTING_PAGE_SIZE = 200
+
+# Viewer sort fields; each gets a compound (field, _id) index, which
+# matches the keyset order and also serves plain ic_name lookups
+INDEXED_FIELDS = ("ic_name", "timestamp")
+
+# Viewer rows; has_photo is computed server-side
+LISTING_STAGE = {"$project": {
+    "ic_name": 1,
+    "readings": 1,
+    "timestamp": 1,
+    "has_photo": {"$or": [
+        {"$ne": [{"$type": "$photo_id"}, "missing"]},
+        {"$ne": [{"$type": "$photo"}, "missing"]},
+    ]},
+}}
+
+# Photos live in GridFS; thumbnails (longest side in pixels) are generated at ingest
+PHOTO_BUCKET = "ic_photos"
+THUMBNAIL_SIZES = (160, 320, 640)
+THUMBNAIL_QUALITY = 85
+
+
+def make_thumbnail(photo_bytes, size):
+    """Downscale a photo so its longest side is at most size, encoded as JPEG"""
+    image = Image.open(io.BytesIO(photo_bytes))
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def make_thumbnails(photo_bytes):
+    """Every THUMBNAIL_SIZES rendition of a photo; raises OSError if it is not an image"""
+    return {size: make_thumbnail(photo_bytes, size) for size in THUMBNAIL_SIZES}
+
+
+def keyset_after(field, value, doc_id, descending=False):
+    """Filter for rows after (value, doc_id) in (field, _id) order.
+
+    Missing or null values sort first ascending (last descending), and
+    range operators never match them, so they get their own branch.
+    """
+    op = "$lt" if descending else "$gt"
+    same = {field: value, "_id": {op: doc_id}}
+    if value is None:
+        return {"$or": [same, {field: {"$ne": None}}]} if not descending else same
+    after = {"$or": [{field: {op: value}}, same]}
+    if descending:
+        after["$or"].append({field: None})
+    return after
+
+
+class ICStore:
+    """Data-access layer over the IC collection.
+
+    Every read names the fields it needs, so signature scans and listings
+    never pull photos, raw messages or comparison results.
+    """
+
+    def __init__(self, collection, compact_dtype=None):
+        self.collection = collection
+        # When set ("<f4" or "<f8"), readings/messages are written as Binary blobs
+        self.compact_dtype = compact_dtype
+        self.photos = gridfs.GridFS(collection.database, collection=PHOTO_BUCKET)
+        self.tombstones = collection.database[collection.name + TOMBSTONE_SUFFIX]
+        self.tombstone_ttl = TOMBSTONE_TTL
+        # Number of compact (Binary) readings, counted on first use and
+        # recounted after writes that may change it
+        self._compact_count = None
+
+    def iter_signatures(self, query=None, batch_size=SIGNATURE_BATCH_SIZE):
+        """Stream ic_name/readings/timestamp, by default of all documents with readings.
+
+        A query is passed through unchanged, so documents that lost their
+        readings still come back and callers can treat them as removed.
+        """
+        if query is None:
+            query = {"readings": {"$exists": True}}
+        return self.collection.find(query, SIGNATURE_PROJECTION, batch_size=batch_size)
+
+    def iter_modified(self, window, batch_size=SIGNATURE_BATCH_SIZE):
+        """Stream documents written within window (a modified_at condition), with or without readings"""
+        return self.iter_signatures({MODIFIED_FIELD: window}, batch_size)
+
+    def iter_deletions(self, window, batch_size=SIGNATURE_BATCH_SIZE):
+        """Stream _ids of documents deleted within window (a deleted_at condition)"""
+        return self.tombstones.find({DELETED_FIELD: window}, ID_PROJECTION, batch_size=batch_size)
+
+    def sync_point(self):
+        """Newest server-side modified_at/deleted_at stamp, or None"""
+        newest = None
+        for collection, field in ((self.collection, MODIFIED_FIELD),
+                                  (self.tombstones, DELETED_FIELD)):
+            doc = collection.find_one({field: {"$exists": True}}, {"_id": 0, field: 1},
+                                      sort=[(field, -1)])
+            if doc and (newest is None or doc[field] > newest):
+                newest = doc[field]
+        return newest
+
+    def server_time(self):
+        """Current time on the server (naive UTC, like the stored stamps)"""
+        return self.collection.database.client.admin.command("hello")["localTime"]
+
+    def listing_page(self, sort="ic_name", descending=False, after=None,
+                     search=None, regex=False, limit=LISTING_PAGE_SIZE):
+        """One page of viewer rows, ordered by (sort, _id).
+
+        Keyset pagination: after is the (sort value, _id) of the last row
+        of the previous page, so a page starts with a seek on the compound
+        (sort, _id) index instead of skipping rows, whatever its depth.
+        search filters ic_name server-side, as an anchored prefix or, with
+        regex=True, a case-insensitive regular expression. Only the prefix
+        sorted by ic_name narrows the index range; other searches walk the
+        index in sort order and filter, so a rare match costs a longer walk.
+        """
+        if sort not in INDEXED_FIELDS:
+            raise ValueError(f"Can only sort on {', '.join(INDEXED_FIELDS)}")
+        conditions = []
+        if search:
+            pattern = search if regex else "^" + re.escape(search)
+            conditions.append({"ic_name": {"$regex": pattern, "$options": "i" if regex else ""}})
+        if after is not None:
+            conditions.append(keyset_after(sort, after[0], after[1], descending))
+
+        direction = -1 if descending else 1
+        pipeline = [
+            {"$match": {"$and": conditions} if conditions else {}},
+            {"$sort": {sort: direction, "_id": direction}},
+            {"$limit": int(limit)},
+            LISTING_STAGE,
+        ]
+        return list(self.collection.aggregate(pipeline))
+
+    def get_photo(self, ic_name, max_size=None):
+        """Return (image bytes, is_original) for the smallest stored rendition
+        that covers max_size, or None if the IC has no photo.
+
+        Documents that still carry a legacy base64 "photo" field are served
+        from it until they are migrated.
+        """
+        doc = self.collection.find_one(
+            {"ic_name": ic_name, "$or": [{"photo_id": {"$exists": True}},
+                                         {"photo": {"$exists": True}}]},
+            PHOTO_PROJECTION)
+        if not doc:
+            return None
+
+        if "photo_id" not in doc:
+            return base64.b64decode(doc["photo"]), True
+
+        if max_size is not None:
+            needed = max(max_size)
+            thumbnails = doc.get("thumbnails", {})
+            for size in sorted(int(s) for s in thumbnails):
+                if size >= needed:
+                    return self.photos.get(thumbnails[str(size)]).read(), False
+
+        return self.photos.get(doc["photo_id"]).read(), True
+
+    def put_photo(self, ic_name, photo_bytes, thumbnails=None):
+        """Store a photo and its thumbnails in GridFS and link them to the IC.
+
+        thumbnails (from make_thumbnails) are generated here if not given.
+        Files already written are deleted again if a later step fails.
+        """
+        if thumbnails is None:
+            thumbnails = make_thumbnails(photo_bytes)
+        old = self.collection.find_one({"ic_name": ic_name}, PHOTO_FILES_PROJECTION)
+
+        written = {"thumbnails": {}}
+        try:
+            written["photo_id"] = self.photos.put(photo_bytes, filename=ic_name,
+                                                  metadata={"ic_name": ic_name, "kind": "original"})
+            for size, data in thumbnails.items():
+                written["thumbnails"][str(size)] = self.photos.put(
+                    data, filename=f"{ic_name}_{size}", contentType="image/jpeg",
+                    metadata={"ic_name": ic_name, "kind": "thumbnail", "size": size})
+
+            result = self.collection.update_one(
+                {"ic_name": ic_name},
+                {"$set": {"photo_id": written["photo_id"], "thumbnails": written["thumbnails"]},
+                 "$unset": {"photo": ""}})
+            if result.matched_count == 0:
+                raise KeyError(f"No IC named {ic_name}")
+        except Exception:
+            self._delete_photo_files(written)
+            raise
+
+        if old:
+            self._delete_photo_files(old)
+
+    def _delete_photo_files(self, doc):
+        file_ids = list(doc.get("thumbnails", {}).values())
+        if doc.get("photo_id") is not None:
+            file_ids.append(doc["photo_id"])
+        for file_id in file_ids:
+            self.photos.delete(file_id)
+
+    def migrate_photos(self, progress=None):
+        """Move legacy base64 photos into GridFS, returns the number migrated"""
+        migrated = 0
+        cursor = self.collection.find({"photo": {"$exists": True}},
+                                      {"_id": 0, "ic_name": 1, "photo": 1}, batch_size=1)
+        for doc in cursor:
+            self.put_photo(doc["ic_name"], base64.b64decode(doc["photo"]))
+            migrated += 1
+            if progress:
+                progress(migrated, doc["ic_name"])
+        return migrated
+
+    def migrate_compact(self, dtype="<f4", progress=None):
+        """Re-encode array readings/messages as compact blobs"""
+        migrated = 0
+        query = {"$or": [{"readings": {"$type": "array"}}, {"messages": {"$type": "array"}}]}
+        cursor = self.collection.find(query, {"readings": 1, "messages": 1, "ic_name": 1},
+                                      batch_size=LISTING_BATCH_SIZE)
+        for doc in cursor:
+            fields = compact_fields({k: doc[k] for k in ("readings", "messages") if k in doc}, dtype)
+            self.collection.update_one({"_id": doc["_id"]},
+                                       {"$set": fields, "$currentDate": {MODIFIED_FIELD: True}})
+            migrated += 1
+            if progress:
+                progress(migrated, doc.get("ic_name"))
+        self._compact_count = None
+        return migrated
+
+    def migrate_expand(self, progress=None):
+        """Turn compact blobs back into plain arrays"""
+        migrated = 0
+        query = {"$or": [{"readings": {"$type": "binData"}}, {"messages": {"$type": "binData"}}]}
+        cursor = self.collection.find(query, {"readings": 1, "messages": 1, "ic_name": 1},
+                                      batch_size=LISTING_BATCH_SIZE)
+        for doc in cursor:
+            fields = {k: decode_list(doc[k]) for k in ("readings", "messages") if k in doc}
+            self.collection.update_one({"_id": doc["_id"]},
+                                       {"$set": fields, "$currentDate": {MODIFIED_FIELD: True}})
+            migrated += 1
+            if progress:
+                progress(migrated, doc.get("ic_name"))
+        self._compact_count = None
+        return migrated
+
+    def rank_signatures(self, measured, k, weights=None):
+        """Server-side top-k: SSE (weighted per pin if weights are given)
+        against every 8-value readings array.
+
+        Returns ([(ic_name, sse, readings)], skipped) ordered like
+        SignatureIndex.rank: by SSE, ties broken by ic_name, one entry per
+        ic_name. ICStore writes one document per name; should a collection
+        hold duplicates, the one with the highest _id is scored, which need
+        not be the one the local cache keeps. The final sort is
+        followed by $limit, so the server keeps only k rows while sorting.
+        Compact (Binary) readings cannot be read by the aggregation
+        framework; skipped is how many documents were left out for that
+        reason (expand them with migrate.py).
+        """
+        measured = [float(v) for v in measured]
+        num_pins = len(measured)
+        weights = [1.0] * num_pins if weights is None else [float(w) for w in weights]
+        # Only arrays of num_pins numbers; a null or string element would
+        # make the SSE null or fail the pipeline
+        signature_filter = {"readings": {"$type": "array"},
+                            f"readings.{num_pins - 1}": {"$exists": True},
+                            f"readings.{num_pins}": {"$exists": False},
+                            "$expr": {"$cond": [
+                                {"$isArray": "$readings"},
+                                {"$allElementsTrue": [{"$map": {"input": "$readings",
+                                                                "in": {"$isNumber": "$$this"}}}]},
+                                False,
+                            ]}}
+        squared_error = {
+            "$reduce": {
+                "input": {"$zip": {"inputs": ["$readings", measured, weights]}},
+                "initialValue": 0.0,
+                "in": {"$let": {
+                    "vars": {"diff": {"$subtract": [{"$arrayElemAt": ["$$this", 0]},
+                                                    {"$arrayElemAt": ["$$this", 1]}]}},
+                    "in": {"$add": ["$$value", {"$multiply": [
+                        "$$diff", "$$diff", {"$arrayElemAt": ["$$this", 2]}]}]},
+                }},
+            }
+        }
+        pipeline = [
+            {"$match": signature_filter},
+            # Walks the (ic_name, _id) index, so $last is the highest _id
+            {"$sort": {"ic_name": 1, "_id": 1}},
+            {"$group": {"_id": "$ic_name", "readings": {"$last": "$readings"}}},
+            {"$set": {"sse": squared_error}},
+            {"$sort": {"sse": 1, "_id": 1}},
+            {"$limit": int(k)},
+        ]
+        docs = self.collection.aggregate(pipeline, allowDiskUse=True)
+        matches = [(doc["_id"] if doc["_id"] is not None else "Unknown", doc["sse"], doc["readings"])
+                   for doc in docs]
+        return matches, self.compact_count()
+
+    def compact_count(self):
+        """Documents whose readings are compact (Binary) blobs.
+
+        The count needs a collection scan, so it is cached until a write
+        through this store could change it.
+        """
+        if self._compact_count is None:
+            self._compact_count = self.collection.count_documents({"readings": {"$type": "binData"}})
+        return self._compact_count
+
+    def save(self, ic_name, fields):
+        """Insert or update the IC, returns True if a new document was created"""
+        self._compact_count = None
+        if self.compact_dtype:
+            fields = compact_fields(fields, self.compact_dtype)
+        result = self.collection.update_one(
+            {"ic_name": ic_name}, {"$set": fields, "$currentDate": {MODIFIED_FIELD: True}},
+            upsert=True)
+        return result.upserted_id is not None
+
+    def save_many(self, docs, defaults=None):
+        """Upsert ICs by ic_name in one unordered bulk write.
+
+        defaults holds fields written only when a document is created, and
+        only if the document does not set them itself.
+        Returns (created, updated, errors) with errors as [(index into docs,
+        message)]; a document that fails does not stop the others.
+        """
+        self._compact_count = None
+        if self.compact_dtype:
+            docs = [compact_fields(doc, self.compact_dtype) for doc in docs]
+        requests = []
+        for doc in docs:
+            update = {"$set": doc, "$currentDate": {MODIFIED_FIELD: True}}
+            on_insert = {k: v for k, v in (defaults or {}).items() if k not in doc}
+            if on_insert:
+                update["$setOnInsert"] = on_insert
+            requests.append(UpdateOne({"ic_name": doc["ic_name"]}, update, upsert=True))
+        if not requests:
+            return 0, 0, []
+        try:
+            result = self.collection.bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        errors = [(error["index"], error.get("errmsg", "write error"))
+                  for error in result.get("writeErrors", [])]
+        return result.get("nUpserted", 0), result.get("nMatched", 0), errors
+
+    def delete(self, ic_name):
+        doc = self.collection.find_one_and_delete({"ic_name": ic_name},
+                                                  projection={**PHOTO_FILES_PROJECTION, "_id": 1})
+        if doc is None:
+            return False
+        self._compact_count = None
+        self.tombstones.update_one({"_id": doc["_id"]},
+                                   {"$set": {"ic_name": ic_name},
+                                    "$currentDate": {DELETED_FIELD: True}}, upsert=True)
+        self._delete_photo_files(doc)
+        return True
+
+    def count(self, exact=False):
+        """Number of ICs; estimated from collection metadata unless exact"""
+        if exact:
+            return self.collection.count_documents({})
+        return self.collection.estimated_document_count()
+
+    def ensure_indexes(self):
+        """Create missing indexes; one round trip when they already exist"""
+        existing = self.collection.index_information()
+        for field in INDEXED_FIELDS:
+            if f"{field}_1__id_1" not in existing:
+                self.collection.create_index([(field, 1), ("_id", 1)])
+        if f"{MODIFIED_FIELD}_1" not in existing:
+            self.collection.create_index(MODIFIED_FIELD)
+        ttl = int(self.tombstone_ttl.total_seconds())
+        tombstone_index = self.tombstones.index_information().get(f"{DELETED_FIELD}_1")
+        if tombstone_index is None:
+            self.tombstones.create_index(DELETED_FIELD, expireAfterSeconds=ttl)
+        elif tombstone_index.get("expireAfterSeconds") != ttl:
+            self.tombstones.database.command(
+                "collMod", self.tombstones.name,
+                index={"keyPattern": {DELETED_FIELD: 1}, "expireAfterSeconds": ttl})
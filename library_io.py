@@ -0,0 +1,294 @@
+"""Bulk import and export of IC signature libraries.
+
+Formats (picked from the file extension unless --format is given):
+    csv     ic_name,timestamp,pin1..pin8 with a header row (timestamp optional)
+    jsonl   one {"ic_name": ..., "readings": [...], "timestamp": ...} per line
+    npz     names (N,) and readings (N x 8) arrays, optional timestamps (N,)
+
+Timestamps are ISO 8601 strings. An imported row keeps its timestamp; a new
+IC without one is stamped with the import time, an existing one keeps its own.
+
+Imports are written with unordered bulk upserts keyed on ic_name, batch_size
+rows per round trip. Rows that fail to parse or write are collected with
+their line number and do not stop the rest. Exports stream from a
+signature cursor; only NPZ holds the (compact) arrays in memory until the
+file is written.
+
+Usage:
+    python library_io.py --uri "mongodb+srv://..." import library.csv [--batch-size 1000]
+    python library_io.py --uri "mongodb+srv://..." export library.jsonl
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from signature_codec import decode_list
+from signature_index import NUM_PINS
+
+
+FORMATS = ("csv", "jsonl", "npz")
+DEFAULT_BATCH_SIZE = 1000
+PROGRESS_EVERY = 5000
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension == "json":
+        extension = "jsonl"
+    if extension not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}; use one of {', '.join(FORMATS)}")
+    return extension
+
+
+def pin_columns(num_pins=NUM_PINS):
+    return [f"pin{i + 1}" for i in range(num_pins)]
+
+
+# Readers yield (row number, record) where record is a dict or the exception
+# raised while reading that row
+
+def read_csv(path, num_pins=NUM_PINS):
+    columns = pin_columns(num_pins)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in ["ic_name"] + columns if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV header is missing {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, {"ic_name": row["ic_name"], "readings": [row[c] for c in columns],
+                                    "timestamp": row.get("timestamp")}
+
+
+def read_jsonl(path, num_pins=NUM_PINS):
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+
+
+def read_npz(path, num_pins=NUM_PINS):
+    with np.load(path, allow_pickle=False) as data:
+        names = data["names"]
+        readings = data["readings"]
+        timestamps = data["timestamps"] if "timestamps" in data.files else None
+    if len(names) != len(readings):
+        raise ValueError(f"{len(names)} names but {len(readings)} readings")
+    if timestamps is not None and len(timestamps) != len(names):
+        raise ValueError(f"{len(names)} names but {len(timestamps)} timestamps")
+    timestamps = [None] * len(names) if timestamps is None else timestamps.tolist()
+    for number, (name, row, timestamp) in enumerate(zip(names.tolist(), readings.tolist(), timestamps), 1):
+        yield number, {"ic_name": name, "readings": row, "timestamp": timestamp}
+
+
+READERS = {
+    "csv": read_csv,
+    "jsonl": read_jsonl,
+    "npz": read_npz,
+}
+
+
+def parse_timestamp(value):
+    """datetime from an ISO 8601 string, None if the field is empty"""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError("timestamp must be an ISO 8601 string")
+    return datetime.fromisoformat(value.strip())
+
+
+def validate(record, num_pins=NUM_PINS):
+    """(ic_name, readings, timestamp) from a parsed record, ValueError if unusable"""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    ic_name = record.get("ic_name")
+    if not isinstance(ic_name, str) or not ic_name.strip():
+        raise ValueError("missing ic_name")
+    readings = record.get("readings")
+    if not isinstance(readings, (list, tuple)) or len(readings) != num_pins:
+        raise ValueError(f"{ic_name}: need {num_pins} readings")
+    try:
+        readings = [float(v) for v in readings]
+    except (TypeError, ValueError):
+        raise ValueError(f"{ic_name}: readings must be numbers")
+    if not all(math.isfinite(v) for v in readings):
+        raise ValueError(f"{ic_name}: readings must be finite")
+    try:
+        timestamp = parse_timestamp(record.get("timestamp"))
+    except ValueError:
+        raise ValueError(f"{ic_name}: bad timestamp {record.get('timestamp')!r}")
+    return ic_name.strip(), readings, timestamp
+
+
+def import_library(store, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, num_pins=NUM_PINS,
+                   progress=None):
+    """Upsert every valid row of path into store.
+
+    Within a batch the last row for an IC name wins. progress(stats) is
+    called after every batch. Returns stats with rows, created, updated,
+    duplicates, errors ([(row, message)]) and seconds.
+    """
+    fmt = fmt or detect_format(path)
+    stats = {"rows": 0, "created": 0, "updated": 0, "duplicates": 0, "errors": [], "seconds": 0.0}
+    start = time.perf_counter()
+    # Signature caches pick the rows up from the server's modified_at stamp;
+    # the import time only stands in for a missing timestamp on new ICs
+    imported_from = os.path.basename(path)
+    new_ic = {"timestamp": datetime.now()}
+    batch = {}
+
+    def flush():
+        rows, docs = zip(*batch.values())
+        created, updated, errors = store.save_many(list(docs), defaults=new_ic)
+        stats["created"] += created
+        stats["updated"] += updated
+        stats["errors"].extend((rows[index], message) for index, message in errors)
+        batch.clear()
+        if progress:
+            progress(stats)
+
+    for row, record in READERS[fmt](path, num_pins):
+        stats["rows"] += 1
+        try:
+            ic_name, readings, timestamp = validate(record, num_pins)
+        except ValueError as e:
+            stats["errors"].append((row, str(e)))
+            continue
+        if ic_name in batch:
+            stats["duplicates"] += 1
+        doc = {"ic_name": ic_name, "readings": readings, "imported_from": imported_from}
+        if timestamp is not None:
+            doc["timestamp"] = timestamp
+        batch[ic_name] = (row, doc)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def iter_library(store):
+    """(ic_name, readings, timestamp) for every stored signature, streamed"""
+    for doc in store.iter_signatures():
+        readings = decode_list(doc.get("readings"))
+        timestamp = doc.get("timestamp")
+        yield (doc.get("ic_name", "Unknown"), readings,
+               timestamp.isoformat() if isinstance(timestamp, datetime) else None)
+
+
+def write_csv(path, rows, num_pins=NUM_PINS):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ic_name", "timestamp"] + pin_columns(num_pins))
+        for ic_name, readings, timestamp in rows:
+            writer.writerow([ic_name, timestamp or ""] + readings)
+
+
+def write_jsonl(path, rows, num_pins=NUM_PINS):
+    with open(path, "w", encoding="utf-8") as f:
+        for ic_name, readings, timestamp in rows:
+            f.write(json.dumps({"ic_name": ic_name, "readings": readings, "timestamp": timestamp}) + "\n")
+
+
+def write_npz(path, rows, num_pins=NUM_PINS):
+    names, readings, timestamps = [], [], []
+    for ic_name, values, timestamp in rows:
+        names.append(ic_name)
+        readings.append(values)
+        timestamps.append(timestamp or "")
+    np.savez_compressed(path, names=np.array(names, dtype=str),
+                        readings=np.array(readings, dtype=np.float64).reshape(-1, num_pins),
+                        timestamps=np.array(timestamps, dtype=str))
+
+
+WRITERS = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+    "npz": write_npz,
+}
+
+
+def export_library(store, path, fmt=None, num_pins=NUM_PINS, progress=None):
+    """Write every signature with num_pins readings to path.
+
+    progress(rows) is called every PROGRESS_EVERY rows. Returns stats with
+    rows, skipped (malformed readings) and seconds.
+    """
+    fmt = fmt or detect_format(path)
+    stats = {"rows": 0, "skipped": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    def rows():
+        for ic_name, readings, timestamp in iter_library(store):
+            if readings is None or len(readings) != num_pins:
+                stats["skipped"] += 1
+                continue
+            stats["rows"] += 1
+            if progress and stats["rows"] % PROGRESS_EVERY == 0:
+                progress(stats["rows"])
+            yield ic_name, readings, timestamp
+
+    WRITERS[fmt](path, rows(), num_pins)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export the IC signature library")
+    parser.add_argument("--uri", required=True, help="MongoDB connection string")
+    parser.add_argument("--db", default="ic_tester", help="Database name")
+    parser.add_argument("--collection", default="ic_database", help="Collection name")
+    parser.add_argument("--format", choices=FORMATS, help="File format (default: from the extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows per bulk write when importing")
+    parser.add_argument("--dtype", choices=["<f4", "<f8"],
+                        help="Store imported readings as compact blobs")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="Library file")
+    args = parser.parse_args(argv)
+
+    import pymongo
+    from ic_store import ICStore
+
+    client = pymongo.MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    try:
+        store = ICStore(client[args.db][args.collection], compact_dtype=args.dtype)
+        if args.action == "import":
+            stats = import_library(store, args.path, args.format, args.batch_size,
+                                   progress=lambda s: print(f"[{s['rows']}] rows read", flush=True))
+            rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            print(f"Imported {stats['rows']} rows in {stats['seconds']:.2f} s ({rate:.0f} rows/s): "
+                  f"{stats['created']} created, {stats['updated']} updated, "
+                  f"{stats['duplicates']} duplicates, {len(stats['errors'])} errors")
+            for row, message in stats["errors"][:20]:
+                print(f"  row {row}: {message}", file=sys.stderr)
+            if len(stats["errors"]) > 20:
+                print(f"  ... {len(stats['errors']) - 20} more", file=sys.stderr)
+            return 1 if stats["errors"] else 0
+
+        stats = export_library(store, args.path, args.format,
+                               progress=lambda rows: print(f"[{rows}] rows written", flush=True))
+        rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"Exported {stats['rows']} rows in {stats['seconds']:.2f} s ({rate:.0f} rows/s), "
+              f"{stats['skipped']} skipped")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import numpy as np
+
+from signature_index import NUM_PINS
+
+
+class LivePlot:
+    """Rolling per-pin voltage plot redrawn with Agg blitting.
+
+    The Line2D artists are created once in start() and marked animated, so
+    a full canvas draw only renders the static layer (axes, grid, legend),
+    which is cached with copy_from_bbox. Each refresh restores that
+    background, updates the lines with set_data and blits the axes.
+    push() may be called from any thread; refresh() runs on the Tk loop and
+    redraws at most fps times a second, however fast frames arrive. Pass the
+    run's message count to start() so the x axis spans exactly that many.
+    """
+
+    def __init__(self, canvas, ax, num_pins=NUM_PINS, window=200, fps=15.0, y_range=(0.0, 5.0)):
+        self.canvas = canvas
+        self.ax = ax
+        self.num_pins = num_pins
+        self.window = window
+        self.min_interval = 1.0 / fps
+        self.y_range = y_range
+        self.stats = {"frames": 0, "redraws": 0, "skipped": 0}
+        self.lines = []
+        self._data = np.full((window, num_pins), np.nan)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_draw = 0.0
+        self._background = None
+        self._draw_cid = None
+
+    @property
+    def active(self):
+        return bool(self.lines)
+
+    def start(self, window=None):
+        """Take over the axes and create the artists for a new run of window messages"""
+        with self._lock:
+            if window is not None and window != self.window:
+                self.window = max(int(window), 1)
+                self._data = np.full((self.window, self.num_pins), np.nan)
+            self._data[:] = np.nan
+            self._count = 0
+            self._dirty = False
+        self.ax.clear()
+        # A single-message window still needs a non-empty x range
+        self.ax.set_xlim(-max(self.window, 2) + 1, 0)
+        self.ax.set_ylim(*self.y_range)
+        self.ax.set_xlabel('Messages ago')
+        self.ax.set_ylabel('Voltage')
+        self.ax.set_title('Live pin voltages')
+        self.ax.grid(True, alpha=0.3)
+        self.lines = [self.ax.plot([], [], '-', label=f'Pin {i + 1}', animated=True)[0]
+                      for i in range(self.num_pins)]
+        self.ax.legend(loc='upper left', ncol=4, fontsize=7)
+        if self._draw_cid is None:
+            self._draw_cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.draw()
+
+    def stop(self):
+        """Release the axes (the caller redraws them)"""
+        if self._draw_cid is not None:
+            self.canvas.mpl_disconnect(self._draw_cid)
+            self._draw_cid = None
+        self.lines = []
+        self._background = None
+
+    def push(self, frame):
+        """Append one 8-value frame to the rolling window"""
+        with self._lock:
+            self._data[self._count % self.window] = frame
+            self._count += 1
+            if self._dirty:
+                self.stats["skipped"] += 1
+            self._dirty = True
+            self.stats["frames"] += 1
+
+    def refresh(self):
+        """Blit pending frames if the FPS budget allows"""
+        if not self.lines or not self._dirty or self._background is None:
+            return
+        now = time.monotonic()
+        if now - self._last_draw < self.min_interval:
+            return
+        self._last_draw = now
+
+        with self._lock:
+            count = min(self._count, self.window)
+            # Oldest to newest, without copying more than the window
+            order = (np.arange(self._count - count, self._count)) % self.window
+            recent = self._data[order]
+            self._dirty = False
+
+        x = np.arange(-count + 1, 1)
+        for pin, line in enumerate(self.lines):
+            line.set_data(x, recent[:, pin])
+        self._blit()
+        self.stats["redraws"] += 1
+
+    def _blit(self):
+        self.canvas.restore_region(self._background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+    def _on_draw(self, event):
+        # A full draw (start, resize) renders only the static layer; cache
+        # it and put the animated lines back on top
+        if not self.lines:
+            return
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
@@ -0,0 +1,71 @@
+import threading
+
+
+class LiveRanker:
+    """Background worker that re-ranks the running signature while data
+    is still being collected.
+
+    Jobs are coalesced: submit() replaces any job that has not started yet,
+    so the worker always ranks the newest signature and never queues behind
+    the serial stream. Results are picked up on the Tk thread with latest(),
+    and cancel() discards everything from the previous test.
+    """
+
+    def __init__(self, rank, k=10):
+        self.rank = rank
+        self.k = k
+        self.stats = {"submitted": 0, "coalesced": 0, "completed": 0, "errors": 0}
+        self._cond = threading.Condition()
+        self._job = None
+        self._result = None
+        self._generation = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="live-ranking", daemon=True)
+        self._thread.start()
+
+    def submit(self, measured, weights=None, frames=None):
+        """Rank measured (after frames messages) as soon as the worker is free"""
+        with self._cond:
+            if self._job is not None:
+                self.stats["coalesced"] += 1
+            self._job = (self._generation, list(measured), weights, frames)
+            self.stats["submitted"] += 1
+            self._cond.notify()
+
+    def cancel(self):
+        with self._cond:
+            self._generation += 1
+            self._job = None
+            self._result = None
+
+    def latest(self):
+        """Newest (frames, results, error) not yet picked up, or None"""
+        with self._cond:
+            result, self._result = self._result, None
+            return result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._job is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                (generation, measured, weights, frames), self._job = self._job, None
+
+            try:
+                results, error = self.rank(measured, self.k, weights), None
+                self.stats["completed"] += 1
+            except Exception as e:
+                results, error = None, e
+                self.stats["errors"] += 1
+
+            with self._cond:
+                if generation == self._generation:
+                    self._result = (frames, results, error)
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._job = None
+            self._cond.notify()
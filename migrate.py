@@ -0,0 +1,65 @@
+"""Database migrations for the IC tester collection.
+
+Usage:
+    python migrate.py --uri "mongodb+srv://..." photos
+    python migrate.py --uri "mongodb+srv://..." compact [--dtype <f8]
+    python migrate.py --uri "mongodb+srv://..." expand
+"""
+import argparse
+import sys
+
+import pymongo
+
+from ic_store import ICStore
+
+
+def print_progress(done, ic_name):
+    print(f"[{done}] {ic_name}", flush=True)
+
+
+def migrate_photos(store, args):
+    """Move base64 photos into GridFS and generate thumbnails"""
+    count = store.migrate_photos(progress=print_progress)
+    print(f"Migrated {count} photos to GridFS")
+
+
+def migrate_compact(store, args):
+    """Encode readings and messages as compact Binary blobs"""
+    count = store.migrate_compact(args.dtype, progress=print_progress)
+    print(f"Compacted {count} documents ({args.dtype})")
+
+
+def migrate_expand(store, args):
+    """Decode compact blobs back into BSON arrays"""
+    count = store.migrate_expand(progress=print_progress)
+    print(f"Expanded {count} documents")
+
+
+MIGRATIONS = {
+    "photos": migrate_photos,
+    "compact": migrate_compact,
+    "expand": migrate_expand,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate the IC tester database")
+    parser.add_argument("--uri", required=True, help="MongoDB connection string")
+    parser.add_argument("--db", default="ic_tester", help="Database name")
+    parser.add_argument("--collection", default="ic_database", help="Collection name")
+    parser.add_argument("--dtype", default="<f4", choices=["<f4", "<f8"],
+                        help="Element type for the compact migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS), help="Migration to run")
+    args = parser.parse_args(argv)
+
+    client = pymongo.MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    try:
+        store = ICStore(client[args.db][args.collection])
+        MIGRATIONS[args.migration](store, args)
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
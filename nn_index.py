@@ -0,0 +1,315 @@
+"""Tree-based nearest-neighbour backends for the signature index.
+
+KDTreeSignatureIndex keeps the SignatureIndex API (load/upsert/remove/rank)
+but answers top-k queries with a KD-tree instead of scoring every row.
+Changes since the last build go to a small brute-force delta and removed
+or replaced rows are tombstoned, so saves and deletes stay O(1); the tree
+is rebuilt once the delta grows past rebuild_fraction of the library.
+
+Run "python nn_index.py" for a recall/latency report against brute force.
+"""
+import argparse
+import heapq
+import time
+
+import numpy as np
+
+from signature_index import NUM_PINS, SignatureIndex, rank_order
+
+
+class KDTree:
+    """Static KD-tree over an N x D array with contiguous leaf buckets"""
+
+    def __init__(self, points, leaf_size=32):
+        points = np.asarray(points, dtype=np.float64)
+        self.leaf_size = leaf_size
+        perm = np.arange(len(points))
+        starts, ends, lefts, rights, los, his = [], [], [], [], [], []
+
+        def new_node(start, end):
+            block = points[perm[start:end]]
+            los.append(block.min(axis=0))
+            his.append(block.max(axis=0))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        stack = [new_node(0, len(points))] if len(points) else []
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+            spread = his[node] - los[node]
+            dim = int(np.argmax(spread))
+            if spread[dim] == 0:
+                continue
+            # Median split on the widest dimension
+            mid = (start + end) // 2
+            segment = perm[start:end]
+            perm[start:end] = segment[np.argpartition(points[segment, dim], mid - start)]
+            lefts[node] = new_node(start, mid)
+            rights[node] = new_node(mid, end)
+            stack.extend((lefts[node], rights[node]))
+
+        self.indices = perm
+        self.points = points[perm]
+        self.starts = starts
+        self.ends = ends
+        self.lefts = lefts
+        self.rights = rights
+        self.lo = np.array(los).reshape(-1, points.shape[1])
+        self.hi = np.array(his).reshape(self.lo.shape)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _box_distance(self, node, target):
+        gap = np.maximum(self.lo[node] - target, 0) + np.maximum(target - self.hi[node], 0)
+        return float(gap @ gap)
+
+    def query(self, target, k, eps=0.0, with_ties=False):
+        """Return (squared distances, original indices) of the k nearest points.
+
+        eps > 0 gives an approximate search: a branch is skipped unless it
+        could beat the current k-th best by more than a factor (1 + eps),
+        trading recall for fewer visited leaves. with_ties also returns every
+        other point as close as the k-th.
+        """
+        if not len(self.points) or k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.intp)
+
+        target = np.asarray(target, dtype=np.float64)
+        k = min(k, len(self.points))
+        scale = (1.0 + eps) ** 2
+        frontier = [(self._box_distance(0, target), 0)]
+        best = []  # max-heap of (-distance, -position)
+
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            if len(best) == k and bound * scale >= -best[0][0]:
+                break
+
+            if self.lefts[node] < 0:
+                start = self.starts[node]
+                diff = self.points[start:self.ends[node]] - target
+                distances = np.einsum("ij,ij->i", diff, diff)
+                if len(best) == k:
+                    candidates = np.flatnonzero(distances < -best[0][0])
+                else:
+                    candidates = range(len(distances))
+                for j in candidates:
+                    item = (-float(distances[j]), -(start + int(j)))
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                continue
+
+            for child in (self.lefts[node], self.rights[node]):
+                child_bound = self._box_distance(child, target)
+                if len(best) < k or child_bound * scale < -best[0][0]:
+                    heapq.heappush(frontier, (child_bound, child))
+
+        best.sort(reverse=True)
+        if with_ties and len(best) == k:
+            return self.within(target, -best[-1][0])
+        distances = np.array([-d for d, _ in best])
+        positions = np.array([-p for _, p in best], dtype=np.intp)
+        return distances, self.indices[positions]
+
+    def within(self, target, radius):
+        """(squared distances, original indices) of every point with squared
+        distance <= radius, nearest first"""
+        target = np.asarray(target, dtype=np.float64)
+        found_distances, found_positions = [], []
+        stack = [0] if len(self.points) else []
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, target) > radius:
+                continue
+            if self.lefts[node] < 0:
+                start = self.starts[node]
+                diff = self.points[start:self.ends[node]] - target
+                distances = np.einsum("ij,ij->i", diff, diff)
+                inside = np.flatnonzero(distances <= radius)
+                found_distances.append(distances[inside])
+                found_positions.append(start + inside)
+                continue
+            stack.extend((self.lefts[node], self.rights[node]))
+
+        if not found_distances:
+            return np.empty(0), np.empty(0, dtype=np.intp)
+        distances = np.concatenate(found_distances)
+        positions = np.concatenate(found_positions)
+        order = np.argsort(distances, kind="stable")
+        return distances[order], self.indices[positions[order]]
+
+
+class KDTreeSignatureIndex(SignatureIndex):
+    """SignatureIndex answering rank() from a KD-tree plus a brute-force delta"""
+
+    def __init__(self, num_pins=NUM_PINS, initial_capacity=256, eps=0.0,
+                 leaf_size=32, rebuild_fraction=0.1):
+        super().__init__(num_pins, initial_capacity)
+        self.eps = eps
+        self.leaf_size = leaf_size
+        self.rebuild_fraction = rebuild_fraction
+        self._tree = None
+        self._tree_names = []
+        self._in_tree = set()
+        self._stale = set()
+        self._delta = set()
+
+    def _rebuild(self):
+        with self._lock:
+            count = len(self._names)
+            self._tree = KDTree(self._matrix[:count].copy(), self.leaf_size)
+            self._tree_names = list(self._names)
+            self._in_tree = set(self._tree_names)
+            self._stale = set()
+            self._delta = set()
+
+    def _maybe_rebuild(self):
+        if len(self._delta) + len(self._stale) > self.rebuild_fraction * max(len(self._names), 1):
+            self._rebuild()
+
+    def load(self, documents):
+        super().load(documents)
+        self._rebuild()
+
+    def load_arrays(self, names, readings):
+        super().load_arrays(names, readings)
+        self._rebuild()
+
+    def invalidate(self):
+        with self._lock:
+            super().invalidate()
+            self._tree = None
+            self._tree_names = []
+            self._in_tree = set()
+            self._stale = set()
+            self._delta = set()
+
+    def upsert(self, ic_name, readings):
+        if len(readings) != self.num_pins:
+            return
+        with self._lock:
+            super().upsert(ic_name, readings)
+            if self._tree is not None:
+                if ic_name in self._in_tree:
+                    self._stale.add(ic_name)
+                self._delta.add(ic_name)
+                self._maybe_rebuild()
+
+    def remove(self, ic_name):
+        with self._lock:
+            removed = super().remove(ic_name)
+            if removed and self._tree is not None:
+                self._delta.discard(ic_name)
+                if ic_name in self._in_tree:
+                    self._stale.add(ic_name)
+                self._maybe_rebuild()
+            return removed
+
+    def rank(self, measured, k=None, weights=None):
+        with self._lock:
+            count = len(self._names)
+            # The tree is built for plain SSE; weighted queries scan all rows
+            if self._tree is None or weights is not None or k is None or k <= 0 or k >= count:
+                return super().rank(measured, k, weights)
+
+            target = np.asarray(measured, dtype=np.float64)
+
+            # Over-fetch by the number of tombstones so k live rows remain;
+            # exact queries also get every tie at the k-th place, so ties are
+            # broken by name like the brute-force index
+            distances, indices = self._tree.query(target, k + len(self._stale), self.eps,
+                                                  with_ties=self.eps == 0)
+            names = [self._tree_names[i] for i in indices]
+            live = [j for j, name in enumerate(names) if name not in self._stale]
+            scores = [distances[live]]
+            names = [names[j] for j in live]
+
+            if self._delta:
+                rows = [self._rows[name] for name in self._delta]
+                diff = self._matrix[rows] - target
+                scores.append(np.einsum("ij,ij->i", diff, diff))
+                names.extend(self._names[r] for r in rows)
+
+            scores = np.concatenate(scores)
+            best = rank_order(scores, names, k)
+            return [(names[j], float(scores[j]), self._matrix[self._rows[names[j]]].tolist())
+                    for j in best.tolist()]
+
+
+def create_signature_index(backend="brute", **options):
+    """Factory for the signature index backends ("brute", "kdtree" or "sharded")"""
+    if backend == "brute":
+        return SignatureIndex()
+    if backend == "kdtree":
+        return KDTreeSignatureIndex(**options)
+    if backend == "sharded":
+        from sharded_matcher import ShardedSignatureIndex
+        return ShardedSignatureIndex(**options)
+    raise ValueError(f"Unknown index backend: {backend}")
+
+
+def synthetic_library(size, num_pins=NUM_PINS, families=200, seed=0):
+    """Clustered signatures: part families with small per-part variation"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0.0, 5.0, (families, num_pins))
+    members = centers[rng.integers(0, families, size)]
+    return np.clip(members + rng.normal(0.0, 0.15, (size, num_pins)), 0.0, 5.0)
+
+
+def recall_report(size=100000, queries=200, k=10, eps_values=(0.0, 0.5, 1.0, 2.0), seed=0):
+    """Compare KD-tree recall@k and latency against the brute-force index"""
+    library = synthetic_library(size, seed=seed)
+    names = [f"IC_{i}" for i in range(size)]
+    rng = np.random.default_rng(seed + 1)
+    probes = library[rng.integers(0, size, queries)] + rng.normal(0.0, 0.05, (queries, NUM_PINS))
+
+    brute = SignatureIndex()
+    brute.load_arrays(names, library)
+    start = time.perf_counter()
+    truth = [{name for name, _, _ in brute.rank(p, k)} for p in probes]
+    brute_ms = (time.perf_counter() - start) * 1000 / queries
+
+    rows = [("brute force", 1.0, brute_ms, 0.0)]
+    for eps in eps_values:
+        index = KDTreeSignatureIndex(eps=eps)
+        start = time.perf_counter()
+        index.load_arrays(names, library)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [{name for name, _, _ in index.rank(p, k)} for p in probes]
+        latency_ms = (time.perf_counter() - start) * 1000 / queries
+
+        recall = sum(len(f & t) for f, t in zip(found, truth)) / (k * queries)
+        rows.append((f"kdtree eps={eps:g}", recall, latency_ms, build_s))
+
+    print(f"library={size} queries={queries} k={k}")
+    print(f"{'index':<18}{'recall@k':>10}{'ms/query':>10}{'build s':>10}{'speedup':>10}")
+    for label, recall, latency_ms, build_s in rows:
+        print(f"{label:<18}{recall:>10.3f}{latency_ms:>10.3f}{build_s:>10.2f}"
+              f"{brute_ms / latency_ms:>9.1f}x")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KD-tree vs brute-force signature matching")
+    parser.add_argument("--size", type=int, default=100000, help="Library size")
+    parser.add_argument("--queries", type=int, default=200, help="Number of probe signatures")
+    parser.add_argument("-k", type=int, default=10, help="Matches per query")
+    parser.add_argument("--eps", type=float, nargs="+", default=[0.0, 0.5, 1.0, 2.0],
+                        help="Approximation factors to test (0 = exact)")
+    args = parser.parse_args(argv)
+    recall_report(args.size, args.queries, args.k, args.eps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import io
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_BUDGET_BYTES = 128 * 1024 * 1024
+
+# Cached "this IC has no photo" answer, so misses don't hit the database again
+NO_PHOTO = object()
+
+
+class PhotoUnavailable(Exception):
+    """Raised by load_photo when the store cannot be asked (e.g. offline)"""
+
+
+def decode_photo(photo_bytes):
+    """Decode image bytes into a fully loaded PIL image"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(photo_bytes))
+    image.load()
+    return image
+
+
+def image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class PhotoCache:
+    """Bounded LRU cache of decoded IC photos and rendered thumbnails.
+
+    Entries are keyed by (ic_name, None) for the decoded source image (the
+    original or a stored thumbnail) and by (ic_name, (width, height)) for
+    rendered thumbnails, and evicted oldest-first once the byte budget is
+    exceeded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        value = self._lookup(key)
+        self._count(value is not None)
+        return value
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def invalidate(self, ic_name):
+        """Drop the original and every thumbnail of ic_name"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == ic_name]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def get_thumbnail(self, ic_name, max_size, load_photo):
+        """Return a thumbnail that fits max_size, or None if there is no photo.
+
+        load_photo(ic_name, max_size) must return (image bytes, is_original),
+        or None when the store has no photo, and raise PhotoUnavailable when
+        it cannot tell. It is only called when no cached source image is
+        large enough to render max_size from. Each call counts as one hit,
+        or one miss if load_photo had to be called.
+        """
+        max_size = (int(max_size[0]), int(max_size[1]))
+
+        thumbnail = self._lookup((ic_name, max_size))
+        if thumbnail is not None:
+            self._count(True)
+            return None if thumbnail is NO_PHOTO else thumbnail
+
+        cached = self._lookup((ic_name, None))
+        if cached is NO_PHOTO:
+            self._count(True)
+            return None
+        if cached is not None and (cached[1] or self._covers(cached[0], max_size)):
+            self._count(True)
+            source = cached[0]
+        else:
+            self._count(False)
+            # Only a definite "no photo" is cached; errors propagate uncached
+            photo = load_photo(ic_name, max_size)
+            if not photo:
+                self.put((ic_name, None), NO_PHOTO, 0)
+                return None
+            source = decode_photo(photo[0])
+            self.put((ic_name, None), (source, photo[1]), image_nbytes(source))
+
+        from PIL import Image
+
+        thumbnail = source.copy()
+        thumbnail.thumbnail(max_size, Image.Resampling.LANCZOS)
+        self.put((ic_name, max_size), thumbnail, image_nbytes(thumbnail))
+        return thumbnail
+
+    @staticmethod
+    def _covers(image, max_size):
+        """True if image is large enough to fill max_size without upscaling"""
+        return image.width >= max_size[0] or image.height >= max_size[1]
@@ -0,0 +1,67 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PhotoPrefetcher:
+    """Bounded worker pool that renders photos of the top-ranked matches.
+
+    Work is submitted in rank order and tagged with a generation number;
+    starting a new prefetch cancels everything queued for the previous one.
+    Finished thumbnails are handed to the Tk thread through a queue, since
+    PhotoImage objects may only be created there.
+    """
+
+    def __init__(self, photo_cache, load_photo, max_workers=2):
+        self.photo_cache = photo_cache
+        self.load_photo = load_photo
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="photo-prefetch")
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._futures = []
+
+    def prefetch(self, ic_names, max_size):
+        """Cancel stale work and queue ic_names (best match first)"""
+        with self._lock:
+            self._cancel_locked()
+            generation = self._generation
+            self._futures = [
+                self._executor.submit(self._render, generation, ic_name, max_size)
+                for ic_name in ic_names
+            ]
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        self._generation += 1
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+
+    def _render(self, generation, ic_name, max_size):
+        if generation != self._generation:
+            return
+        try:
+            thumbnail = self.photo_cache.get_thumbnail(ic_name, max_size, self.load_photo)
+            error = None
+        except Exception as e:
+            thumbnail, error = None, e
+        self._results.put((generation, ic_name, max_size, thumbnail, error))
+
+    def drain(self):
+        """Yield (ic_name, max_size, thumbnail, error) finished for the current prefetch"""
+        while True:
+            try:
+                generation, ic_name, max_size, thumbnail, error = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if generation == self._generation:
+                yield ic_name, max_size, thumbnail, error
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
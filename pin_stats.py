@@ -0,0 +1,115 @@
+"""Streaming per-pin statistics with outlier rejection.
+
+PinStatistics folds frames into a Welford mean/variance as they arrive and
+keeps only a fixed window of recent frames for the robust estimates, so
+memory stays constant however long a run is. A frame is flagged as an
+outlier when any pin is more than outlier_threshold robust deviations
+(scaled MAD, floored at noise_floor) from the window median; flagged frames
+are left out of the mean and variance.
+"""
+from collections import deque
+
+import numpy as np
+
+from signature_index import NUM_PINS
+
+
+# Scales a median absolute deviation to a normal standard deviation
+MAD_SCALE = 1.4826
+
+
+class PinStatistics:
+    """Online mean/variance, median and trimmed mean for each pin"""
+
+    def __init__(self, num_pins=NUM_PINS, window=64, trim=0.25, outlier_threshold=5.0,
+                 noise_floor=0.02, min_reference=3, max_flagged=100):
+        self.num_pins = num_pins
+        self.trim = trim
+        self.outlier_threshold = outlier_threshold
+        self.noise_floor = noise_floor
+        self.min_reference = min_reference
+        self.count = 0      # accepted frames
+        self.total = 0      # all frames, including outliers
+        self.outliers = 0
+        self.flagged = deque(maxlen=max_flagged)  # frame numbers of recent outliers
+        self.mean = np.zeros(num_pins)
+        self._m2 = np.zeros(num_pins)
+        self._window = np.zeros((window, num_pins))
+        self._filled = 0
+        self._next = 0
+
+    def add(self, frame):
+        """Fold in one frame; returns False if it was rejected as an outlier"""
+        values = np.asarray(frame, dtype=np.float64)
+        if values.shape != (self.num_pins,):
+            raise ValueError(f"Expected {self.num_pins} values, got {values.shape}")
+        self.total += 1
+
+        accepted = not self.is_outlier(values)
+        if accepted:
+            self.count += 1
+            delta = values - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (values - self.mean)
+        else:
+            self.outliers += 1
+            self.flagged.append(self.total)
+
+        # Outliers still enter the window so a real change of level is followed
+        self._window[self._next] = values
+        self._next = (self._next + 1) % len(self._window)
+        self._filled = min(self._filled + 1, len(self._window))
+        return accepted
+
+    def is_outlier(self, values):
+        if self._filled < self.min_reference:
+            return False
+        recent = self._recent()
+        center = np.median(recent, axis=0)
+        scale = np.maximum(MAD_SCALE * np.median(np.abs(recent - center), axis=0), self.noise_floor)
+        return bool(np.max(np.abs(values - center) / scale) > self.outlier_threshold)
+
+    def _recent(self):
+        return self._window[:self._filled]
+
+    @property
+    def variance(self):
+        """Sample variance per pin (zeros until two frames are accepted)"""
+        if self.count < 2:
+            return np.zeros(self.num_pins)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def median(self):
+        """Per-pin median of the recent window"""
+        if not self._filled:
+            return np.zeros(self.num_pins)
+        return np.median(self._recent(), axis=0)
+
+    def trimmed_mean(self):
+        """Per-pin mean of the recent window without the top and bottom trim
+        fraction, like read_adc_multiple_samples on the ATmega"""
+        if not self._filled:
+            return np.zeros(self.num_pins)
+        ordered = np.sort(self._recent(), axis=0)
+        cut = int(self._filled * self.trim)
+        return ordered[cut:self._filled - cut].mean(axis=0)
+
+    def weights(self):
+        """Inverse-variance pin weights normalised to a mean of 1, or None
+        until there are two accepted frames"""
+        if self.count < 2:
+            return None
+        inverse = 1.0 / np.maximum(self.variance, self.noise_floor ** 2)
+        return inverse * (self.num_pins / inverse.sum())
+
+    def summary(self):
+        """Fields stored with a signature"""
+        return {
+            "variance": self.variance.tolist(),
+            "samples": self.count,
+            "outliers": self.outliers,
+        }
@@ -0,0 +1,124 @@
+"""Adaptive sequential sampling for IC identification.
+
+SequentialSampler keeps a per-pin running mean and variance (a
+PinStatistics accumulator, which also rejects outlier frames) as messages
+arrive and re-ranks the library against the mean after each one.
+It stops once the best candidate beats the runner-up by a statistically
+significant margin.
+
+The SSE gap between runner-up b2 and best match b1 is linear in the mean x:
+
+    D = |x - b2|^2 - |x - b1|^2 = sum_p (b1_p - b2_p) (2 x_p - b1_p - b2_p)
+
+With per-pin variances s_p^2 its standard error is
+
+    sqrt(sum_p 4 (b1_p - b2_p)^2 s_p^2 / n)
+
+and sampling stops when D / SE exceeds the one-sided normal quantile of
+the requested confidence. With pin weights w_p (weighted SSE) each term
+of D is scaled by w_p and each term under the root by w_p^2. Per-pin
+variances are floored at noise_floor^2, because one or two messages say
+little about the noise.
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+from pin_stats import PinStatistics
+from signature_index import NUM_PINS
+
+
+class SequentialSampler:
+    """Running per-pin statistics with an early-stopping rule.
+
+    rank(measured, k, weights) must return [(name, sse, readings)] best
+    first, like SignatureIndex.rank; with weighted=True it gets the
+    accumulator's inverse-variance pin weights, else None. Pass stats to
+    share an accumulator that the caller feeds itself, then call update()
+    after each accepted frame. When rank returns nothing (empty library,
+    server unreachable) sampling stops after fallback_messages instead of
+    running to max_messages.
+    """
+
+    def __init__(self, rank, min_messages=1, max_messages=10, confidence=0.99,
+                 noise_floor=0.02, num_pins=NUM_PINS, stats=None, fallback_messages=None,
+                 weighted=False):
+        if not 1 <= min_messages <= max_messages:
+            raise ValueError("Need 1 <= min_messages <= max_messages")
+        self.rank = rank
+        self.min_messages = min_messages
+        self.max_messages = max_messages
+        self.confidence = confidence
+        self.noise_floor = noise_floor
+        self.threshold = NormalDist().inv_cdf(confidence)
+        self.fallback_messages = fallback_messages
+        self.weighted = weighted
+        self.weights = None
+        self.stats = stats or PinStatistics(num_pins, noise_floor=noise_floor)
+        self.ranking = []
+        self.score = None
+        self.reason = None
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    @property
+    def mean(self):
+        return self.stats.mean
+
+    @property
+    def variance(self):
+        return self.stats.variance
+
+    @property
+    def decided(self):
+        return self.reason is not None
+
+    @property
+    def best(self):
+        return self.ranking[0] if self.ranking else None
+
+    def add(self, message):
+        """Fold in one 8-value message; returns True once sampling can stop"""
+        if not self.stats.add(message):
+            return self.decided
+        return self.update()
+
+    def update(self):
+        """Re-rank against the current mean and apply the stopping rule"""
+        if self.decided or self.count < self.min_messages:
+            return False
+
+        self.weights = self.stats.weights() if self.weighted else None
+        self.ranking = self.rank(self.mean, 2, self.weights)
+        self.score = self.margin_score()
+        if self.score is not None and self.score >= self.threshold:
+            self.reason = "confident"
+        elif not self.ranking and self.fallback_messages and self.count >= self.fallback_messages:
+            self.reason = "nothing to rank"
+        elif self.count >= self.max_messages:
+            self.reason = "max messages"
+        return self.decided
+
+    def margin_score(self):
+        """Standardised margin of the best match over the runner-up.
+
+        Infinite when there is no runner-up, None when nothing ranked.
+        """
+        if not self.ranking:
+            return None
+        if len(self.ranking) == 1:
+            return float("inf")
+
+        best = np.asarray(self.ranking[0][2], dtype=np.float64)
+        second = np.asarray(self.ranking[1][2], dtype=np.float64)
+        diff = best - second
+        if self.weights is not None:
+            diff = diff * self.weights
+        gap = float(diff @ (2 * self.mean - best - second))
+        variance = np.maximum(self.variance, self.noise_floor ** 2)
+        se = float(np.sqrt(4 * (diff * diff) @ variance / self.count))
+        if se == 0:
+            return float("inf") if gap > 0 else 0.0
+        return gap / se
@@ -0,0 +1,333 @@
+"""Multi-process signature matching over shared memory.
+
+ShardedSignatureIndex keeps its signature matrix in a SharedMemory segment
+that worker processes attach to once, so a query only ships the measured
+vector. Each worker scores its slice of the rows and returns a local top-k;
+the parent merges them. Saves and deletes write straight into the shared
+segment, and growing the matrix moves it to a new segment that workers
+re-attach to on their next request.
+
+Run "python sharded_matcher.py" for a throughput benchmark.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from signature_index import NUM_PINS, SignatureIndex, rank_order, squared_errors, top_k
+
+
+def _attach(name):
+    """Attach to an existing segment without registering it for cleanup"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment with the resource
+        # tracker shared with the parent, which would unlink it twice
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _shard_worker(connection):
+    segment = None
+    segment_name = None
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        request_id, name, capacity, num_pins, start, end, target, k, weights = request
+        try:
+            if name != segment_name:
+                if segment is not None:
+                    segment.close()
+                segment = _attach(name)
+                segment_name = name
+            matrix = np.ndarray((capacity, num_pins), dtype=np.float64, buffer=segment.buf)
+            scores = squared_errors(matrix[start:end], target, weights)
+            local = top_k(scores, k, with_ties=True)
+            connection.send((request_id, start + local, scores[local], None))
+            del matrix
+        except Exception as e:
+            connection.send((request_id, None, None, repr(e)))
+    if segment is not None:
+        segment.close()
+
+
+class ShardedSignatureIndex(SignatureIndex):
+    """SignatureIndex that scores shards of a shared-memory matrix in worker processes.
+
+    Worker replies are awaited without holding the index lock, so saves and
+    deletes go ahead during a query; if the rows changed meanwhile, or a
+    worker died or timed out (it is then respawned), the query is answered
+    in-process instead.
+    """
+
+    def __init__(self, num_pins=NUM_PINS, initial_capacity=256, workers=None,
+                 min_shard_rows=100000, timeout=30.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_shard_rows = min_shard_rows
+        self.timeout = timeout
+        self._segments = {}
+        self._owners = {}
+        self._retired = []
+        self._context = None
+        self._processes = []
+        self._connections = []
+        self._request_ids = itertools.count()
+        # Bumped on every change to the rows, so a query can tell its
+        # replies still describe the current matrix
+        self._generation = 0
+        # One sharded query at a time; taken before the index lock
+        self._query_lock = threading.Lock()
+        super().__init__(num_pins, initial_capacity)
+
+    def _allocate(self, capacity):
+        segment = shared_memory.SharedMemory(create=True, size=max(capacity, 1) * self.num_pins * 8)
+        matrix = np.ndarray((capacity, self.num_pins), dtype=np.float64, buffer=segment.buf)
+        self._segments[segment.name] = segment
+        self._owners[segment.name] = matrix.ctypes.data
+        return matrix
+
+    def _release_unused(self):
+        """Close and unlink segments that no longer back the live matrix"""
+        live = None
+        for name, segment in list(self._segments.items()):
+            if self._owners[name] == self._matrix.ctypes.data:
+                live = segment
+                continue
+            del self._owners[name]
+            self._retired.append(self._segments.pop(name))
+        still_referenced = []
+        for segment in self._retired:
+            try:
+                segment.close()
+                segment.unlink()
+            except BufferError:
+                still_referenced.append(segment)
+            except FileNotFoundError:
+                pass
+        self._retired = still_referenced
+        return live
+
+    def load(self, documents):
+        with self._lock:
+            self._generation += 1
+            super().load(documents)
+
+    def load_arrays(self, names, readings):
+        with self._lock:
+            self._generation += 1
+            super().load_arrays(names, readings)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            super().invalidate()
+
+    def upsert(self, ic_name, readings):
+        with self._lock:
+            self._generation += 1
+            super().upsert(ic_name, readings)
+
+    def remove(self, ic_name):
+        with self._lock:
+            self._generation += 1
+            return super().remove(ic_name)
+
+    def _spawn(self, slot):
+        """Start the worker for slot, replacing a previous one"""
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_shard_worker, args=(child,), daemon=True)
+        process.start()
+        child.close()
+        if slot < len(self._processes):
+            self._processes[slot] = process
+            self._connections[slot] = parent
+        else:
+            self._processes.append(process)
+            self._connections.append(parent)
+
+    def _restart(self, slot):
+        process = self._processes[slot]
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=2)
+        self._connections[slot].close()
+        self._spawn(slot)
+
+    def start(self):
+        """Spawn the worker processes (done lazily by the first large query)"""
+        if self._processes:
+            return
+        self._context = multiprocessing.get_context("spawn")
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+    def close(self):
+        with self._query_lock:
+            for connection in self._connections:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+            for process, connection in zip(self._processes, self._connections):
+                process.join(timeout=2)
+                if process.is_alive():
+                    process.terminate()
+                connection.close()
+            self._processes = []
+            self._connections = []
+        with self._lock:
+            self._matrix = np.empty((0, self.num_pins), dtype=np.float64)
+            self._release_unused()
+
+    def _collect(self, request_id):
+        """Shard replies as {slot: (rows, scores)}, or None if a worker died
+        or the timeout passed; those workers are respawned"""
+        replies = {}
+        deadline = time.monotonic() + self.timeout
+        while len(replies) < len(self._processes):
+            pending = [slot for slot in range(len(self._processes)) if slot not in replies]
+            remaining = deadline - time.monotonic()
+            waiting = {self._connections[slot]: slot for slot in pending}
+            waiting.update({self._processes[slot].sentinel: slot for slot in pending})
+            ready = wait(list(waiting), timeout=max(remaining, 0)) if remaining > 0 else []
+            if not ready:
+                failed = pending
+            else:
+                failed = []
+                for handle in ready:
+                    slot = waiting[handle]
+                    if slot in replies or slot in failed:
+                        continue
+                    connection = self._connections[slot]
+                    try:
+                        if not connection.poll():
+                            failed.append(slot)  # exited without replying
+                            continue
+                        reply_id, shard_rows, shard_scores, error = connection.recv()
+                    except (EOFError, OSError):
+                        failed.append(slot)
+                        continue
+                    if reply_id != request_id:
+                        continue  # late reply from an abandoned request
+                    if error:
+                        raise RuntimeError(f"Shard worker failed: {error}")
+                    replies[slot] = (shard_rows, shard_scores)
+            if failed:
+                for slot in failed:
+                    self._restart(slot)
+                return None
+        return replies
+
+    def rank(self, measured, k=None, weights=None):
+        with self._lock:
+            if len(self._names) < self.min_shard_rows:
+                return super().rank(measured, k, weights)
+
+        with self._query_lock:
+            # Spawning takes an interpreter start-up, so it happens before
+            # the index lock is taken
+            self.start()
+            for slot, process in enumerate(self._processes):
+                if not process.is_alive():
+                    self._restart(slot)
+
+            with self._lock:
+                count = len(self._names)
+                if count < self.min_shard_rows:
+                    return super().rank(measured, k, weights)
+
+                segment = self._release_unused()
+                generation = self._generation
+                target = np.asarray(measured, dtype=np.float64)
+                shard_weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+                capacity = len(self._matrix)
+                request_id = next(self._request_ids)
+                bounds = np.linspace(0, count, self.workers + 1).astype(int)
+
+            for slot, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                try:
+                    self._connections[slot].send((request_id, segment.name, capacity,
+                                                  self.num_pins, int(start), int(end),
+                                                  target, k, shard_weights))
+                except OSError:
+                    # Died since the liveness check
+                    self._restart(slot)
+                    return super().rank(measured, k, weights)
+
+            # Wait without the index lock, so saves and deletes are not held up
+            replies = self._collect(request_id)
+
+            with self._lock:
+                if replies is None or generation != self._generation:
+                    return super().rank(measured, k, weights)
+
+                # Shards return every tie at their k-th place, so breaking ties
+                # by name here ranks like the base index
+                rows = np.concatenate([replies[slot][0] for slot in sorted(replies)])
+                scores = np.concatenate([replies[slot][1] for slot in sorted(replies)])
+                best = rank_order(scores, [self._names[r] for r in rows.tolist()], k)
+                return [(self._names[r], float(s), self._matrix[r].tolist())
+                        for r, s in zip(rows[best].tolist(), scores[best].tolist())]
+
+
+def benchmark(size=2000000, queries=50, k=10, worker_counts=(1, 2, 4), seed=0):
+    """Queries per second of the sharded engine against in-process brute force"""
+    rng = np.random.default_rng(seed)
+    library = rng.uniform(0.0, 5.0, (size, NUM_PINS))
+    names = [f"IC_{i}" for i in range(size)]
+    probes = rng.uniform(0.0, 5.0, (queries, NUM_PINS))
+
+    baseline = SignatureIndex()
+    baseline.load_arrays(names, library)
+    start = time.perf_counter()
+    expected = [baseline.rank(p, k) for p in probes]
+    baseline_qps = queries / (time.perf_counter() - start)
+
+    print(f"library={size} queries={queries} k={k}")
+    print(f"{'engine':<16}{'queries/s':>12}{'speedup':>10}{'match':>8}")
+    print(f"{'in-process':<16}{baseline_qps:>12.1f}{1.0:>9.1f}x{'yes':>8}")
+
+    for workers in worker_counts:
+        index = ShardedSignatureIndex(workers=workers, min_shard_rows=0)
+        try:
+            index.load_arrays(names, library)
+            index.start()
+            index.rank(probes[0], k)  # warm up the workers
+            start = time.perf_counter()
+            found = [index.rank(p, k) for p in probes]
+            qps = queries / (time.perf_counter() - start)
+        finally:
+            index.close()
+        same = all([n for n, _, _ in a] == [n for n, _, _ in b] for a, b in zip(found, expected))
+        print(f"{f'{workers} workers':<16}{qps:>12.1f}{qps / baseline_qps:>9.1f}x"
+              f"{'yes' if same else 'NO':>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sharded signature matching")
+    parser.add_argument("--size", type=int, default=2000000, help="Library size")
+    parser.add_argument("--queries", type=int, default=50, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="Matches per query")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to test")
+    args = parser.parse_args(argv)
+    benchmark(args.size, args.queries, args.k, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from signature_codec import decode_array
+from signature_index import NUM_PINS
+
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ic_tester", "cache")
+SYNC_EPOCH = datetime(1970, 1, 1)
+# Each delta sync re-reads this much before the last watermark, for writes
+# stamped before it that only became visible after it was read
+SYNC_MARGIN = timedelta(minutes=1)
+
+
+class SignatureCache:
+    """On-disk copy of the signature collection, kept current by delta sync.
+
+    Layout of the cache directory:
+        manifest.json   version, row count, the server stamp last synced to
+                        and the server time of that sync
+        ids.npy         document _id strings
+        names.npy       IC names
+        readings.npy    N x 8 float64 readings (memory-mappable)
+    """
+
+    def __init__(self, db_name, collection_name, cache_dir=DEFAULT_CACHE_DIR, num_pins=NUM_PINS):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{db_name}.{collection_name}")
+        self.path = os.path.join(cache_dir, safe_name)
+        self.num_pins = num_pins
+        self.last_sync = None
+        self.synced_at = None
+        self.ids = []
+        self.names = []
+        self.readings = np.empty((0, num_pins), dtype=np.float64)
+        self._rows = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def load(self):
+        """Load the cache from disk, returns False if there is none"""
+        try:
+            with open(self._file("manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != CACHE_VERSION or manifest.get("num_pins") != self.num_pins:
+                return False
+
+            ids = np.load(self._file("ids.npy"), mmap_mode="r")
+            names = np.load(self._file("names.npy"), mmap_mode="r")
+            readings = np.load(self._file("readings.npy"), mmap_mode="r")
+            if not (len(ids) == len(names) == len(readings) == manifest.get("count")):
+                return False
+
+            # Copy out of the mapping so the files can be replaced on save
+            self.ids = ids.tolist()
+            self.names = names.tolist()
+            self.readings = np.array(readings, dtype=np.float64)
+            del ids, names, readings
+        except (OSError, ValueError, KeyError):
+            return False
+
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        last_sync = manifest.get("last_sync")
+        self.last_sync = datetime.fromisoformat(last_sync) if last_sync else None
+        synced_at = manifest.get("synced_at")
+        self.synced_at = datetime.fromisoformat(synced_at) if synced_at else None
+        return True
+
+    def save(self):
+        """Write the cache atomically (temp files + rename)"""
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {
+            "ids.npy": np.array(self.ids, dtype=str) if self.ids else np.empty(0, dtype="<U24"),
+            "names.npy": np.array(self.names, dtype=str) if self.names else np.empty(0, dtype="<U1"),
+            "readings.npy": self.readings,
+        }
+        for filename, array in arrays.items():
+            tmp = self._file(filename + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, self._file(filename))
+
+        manifest = {
+            "version": CACHE_VERSION,
+            "num_pins": self.num_pins,
+            "count": len(self.ids),
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+        }
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self._file("manifest.json"))
+
+    def clear(self):
+        self.last_sync = None
+        self.synced_at = None
+        self.ids = []
+        self.names = []
+        self.readings = np.empty((0, self.num_pins), dtype=np.float64)
+        self._rows = {}
+
+    def _apply(self, docs):
+        """Upsert changed documents, returns the number of documents seen"""
+        updates = {str(doc["_id"]): doc for doc in docs}
+
+        # Documents whose readings were removed or are unusable leave the cache
+        invalid = []
+        new_ids, new_names, new_readings = [], [], []
+        for doc_id, doc in updates.items():
+            readings = decode_array(doc.get("readings"))
+            if readings is None or readings.shape != (self.num_pins,):
+                invalid.append(doc_id)
+                continue
+            row = self._rows.get(doc_id)
+            if row is None:
+                new_ids.append(doc_id)
+                new_names.append(doc.get("ic_name", "Unknown"))
+                new_readings.append(readings)
+            else:
+                self.names[row] = doc.get("ic_name", "Unknown")
+                self.readings[row] = readings
+
+        if new_ids:
+            start = len(self.ids)
+            self.ids.extend(new_ids)
+            self.names.extend(new_names)
+            self.readings = np.concatenate(
+                [self.readings, np.asarray(new_readings, dtype=np.float64)])
+            for offset, doc_id in enumerate(new_ids):
+                self._rows[doc_id] = start + offset
+
+        self._remove(invalid)
+        return len(updates)
+
+    def _remove(self, doc_ids):
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id in self._rows]
+        if not doc_ids:
+            return 0
+        drop = set(doc_ids)
+        keep = [row for row, doc_id in enumerate(self.ids) if doc_id not in drop]
+        self.ids = [self.ids[row] for row in keep]
+        self.names = [self.names[row] for row in keep]
+        self.readings = self.readings[keep]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        return len(doc_ids)
+
+    def sync(self, store):
+        """Pull documents written or deleted since the last sync.
+
+        Changes are found by the server-side modified_at/deleted_at stamps,
+        so client clocks play no part. The newest stamp is read first and
+        each sync covers (last_sync - SYNC_MARGIN, that stamp]; re-applying
+        the overlap is harmless, and it catches writes stamped before the
+        watermark that were not yet visible when it was read. Deletions
+        come from the tombstone collection, so nothing is read per unchanged
+        document. A cache not synced within the tombstone TTL, measured on
+        the server clock, reloads in full.
+        Returns a dict with the number of changed and removed documents.
+        """
+        now = store.server_time()
+        point = store.sync_point()
+        if self.last_sync is not None and (
+                self.synced_at is None or self.synced_at < now - store.tombstone_ttl + SYNC_MARGIN):
+            # Tombstones for deletions since then may have expired
+            self.clear()
+        self.synced_at = now
+
+        if self.last_sync is None:
+            changed = self._apply(store.iter_signatures())
+            removed = 0
+        elif point is None:
+            return {"changed": 0, "removed": 0}
+        else:
+            window = {"$gt": self.last_sync - SYNC_MARGIN, "$lte": max(point, self.last_sync)}
+            changed = self._apply(store.iter_modified(window))
+            removed = self._remove([str(doc["_id"]) for doc in store.iter_deletions(window)])
+
+        # Nothing stamped yet (empty or legacy collection): any later write is newer
+        self.last_sync = max(point, self.last_sync or point) if point else SYNC_EPOCH
+        return {"changed": changed, "removed": removed}
@@ -0,0 +1,87 @@
+"""Compact binary encoding of readings and raw messages.
+
+A compact value is a BSON Binary holding a 12-byte header followed by the
+little-endian array data:
+
+    magic "IC" | version (u8) | dtype code (b"f" float32, b"d" float64)
+    | rows (u32) | cols (u32)
+
+Version 1 blobs used u16 rows/cols (8-byte header) and are still decoded.
+
+Legacy documents store plain BSON arrays; decode_array accepts both.
+"""
+import struct
+
+import numpy as np
+from bson.binary import Binary
+
+
+CODEC_MAGIC = b"IC"
+CODEC_VERSION = 2
+HEADER = struct.Struct("<2sBcII")
+HEADERS = {1: struct.Struct("<2sBcHH"), CODEC_VERSION: HEADER}
+
+DTYPES = {b"f": np.dtype("<f4"), b"d": np.dtype("<f8")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+
+def encode_array(values, dtype="<f4"):
+    """Pack a 1-D or 2-D sequence of floats into a tagged Binary blob"""
+    dtype = np.dtype(dtype)
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported dtype for compact encoding: {dtype}")
+    array = np.asarray(values, dtype=dtype)
+    if array.ndim == 1:
+        rows, cols = 0, array.shape[0]
+    elif array.ndim == 2:
+        rows, cols = array.shape
+    else:
+        raise ValueError("Only 1-D and 2-D arrays can be encoded")
+    header = HEADER.pack(CODEC_MAGIC, CODEC_VERSION, DTYPE_CODES[dtype], rows, cols)
+    return Binary(header + array.tobytes())
+
+
+def is_compact(value):
+    return isinstance(value, (bytes, Binary)) and value[:2] == CODEC_MAGIC
+
+
+def decode_array(value):
+    """Return a NumPy view of a compact blob, or an array built from a list.
+
+    Blobs are decoded zero-copy with np.frombuffer, so the result is
+    read-only; copy it before modifying. A legacy list that is not numeric
+    (or is ragged) gives None, so callers skip that document.
+    """
+    if value is None:
+        return None
+    if not is_compact(value):
+        try:
+            return np.asarray(value, dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+
+    header = HEADERS.get(value[2])
+    if header is None:
+        raise ValueError(f"Unknown compact encoding (version {value[2]})")
+    magic, version, code, rows, cols = header.unpack_from(value)
+    if code not in DTYPES:
+        raise ValueError(f"Unknown compact encoding (version {version}, dtype {code!r})")
+    array = np.frombuffer(value, dtype=DTYPES[code], offset=header.size)
+    return array.reshape(rows, cols) if rows else array
+
+
+def decode_list(value):
+    """Decode to plain Python floats (lists pass through unchanged)"""
+    if value is None or isinstance(value, list):
+        return value
+    return decode_array(value).tolist()
+
+
+def compact_fields(fields, dtype="<f4"):
+    """Copy of an IC document with readings/messages in compact form"""
+    encoded = dict(fields)
+    for key in ("readings", "messages"):
+        value = encoded.get(key)
+        if value is not None and not is_compact(value) and len(value):
+            encoded[key] = encode_array(value, dtype)
+    return encoded
@@ -0,0 +1,182 @@
+import threading
+
+import numpy as np
+
+from signature_codec import decode_array
+
+
+NUM_PINS = 8
+
+
+class SignatureIndex:
+    """In-memory matrix of IC reference signatures (names + N x 8 readings).
+
+    Built once from the database and patched whenever an IC is saved, added
+    or deleted, so a comparison never has to re-scan the collection.
+    """
+
+    def __init__(self, num_pins=NUM_PINS, initial_capacity=256):
+        self.num_pins = num_pins
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._names = []
+        self._rows = {}
+        self._matrix = self._allocate(initial_capacity)
+
+    def _allocate(self, capacity):
+        """Storage for the signature matrix; subclasses may place it elsewhere"""
+        return np.empty((capacity, self.num_pins), dtype=np.float64)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, ic_name):
+        return ic_name in self._rows
+
+    @property
+    def names(self):
+        with self._lock:
+            return list(self._names)
+
+    @property
+    def matrix(self):
+        """Read-only view of the populated rows"""
+        with self._lock:
+            view = self._matrix[:len(self._names)]
+            view.flags.writeable = False
+            return view
+
+    def load(self, documents):
+        """Rebuild the index from an iterable of IC documents"""
+        names = []
+        rows = {}
+        values = []
+        for doc in documents:
+            readings = decode_array(doc.get("readings"))
+            if readings is None or readings.shape != (self.num_pins,):
+                continue
+            ic_name = doc.get("ic_name", "Unknown")
+            if ic_name in rows:
+                values[rows[ic_name]] = readings
+                continue
+            rows[ic_name] = len(names)
+            names.append(ic_name)
+            values.append(readings)
+
+        matrix = self._allocate(max(len(values), 1) * 2)
+        if values:
+            matrix[:len(values)] = np.asarray(values, dtype=np.float64)
+
+        with self._lock:
+            self._names = names
+            self._rows = rows
+            self._matrix = matrix
+            self.loaded = True
+
+    def load_arrays(self, names, readings):
+        """Rebuild the index from a name list and matching N x 8 array"""
+        rows = {ic_name: row for row, ic_name in enumerate(names)}
+        if len(rows) != len(names):
+            # Duplicate names, keep the last signature like load() does
+            self.load({"ic_name": n, "readings": r} for n, r in zip(names, np.asarray(readings).tolist()))
+            return
+
+        matrix = self._allocate(max(len(names), 1) * 2)
+        matrix[:len(names)] = readings
+
+        with self._lock:
+            self._names = list(names)
+            self._rows = rows
+            self._matrix = matrix
+            self.loaded = True
+
+    def invalidate(self):
+        """Drop all rows; the next comparison reloads from the database"""
+        with self._lock:
+            self._names = []
+            self._rows = {}
+            self.loaded = False
+
+    def upsert(self, ic_name, readings):
+        """Insert or replace the signature stored for ic_name"""
+        if len(readings) != self.num_pins:
+            return
+        with self._lock:
+            row = self._rows.get(ic_name)
+            if row is None:
+                row = len(self._names)
+                if row == len(self._matrix):
+                    grown = self._allocate(len(self._matrix) * 2)
+                    grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+                self._rows[ic_name] = row
+                self._names.append(ic_name)
+            self._matrix[row] = readings
+
+    def remove(self, ic_name):
+        """Remove ic_name, moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(ic_name, None)
+            if row is None:
+                return False
+            last = len(self._names) - 1
+            if row != last:
+                moved = self._names[last]
+                self._names[row] = moved
+                self._matrix[row] = self._matrix[last]
+                self._rows[moved] = row
+            self._names.pop()
+            return True
+
+    def close(self):
+        """Release resources held by the index (nothing for the in-memory one)"""
+
+    def rank(self, measured, k=None, weights=None):
+        """Return the k closest ICs as (name, sse, readings), best first.
+
+        weights, if given, scales each pin's squared error (weighted SSE).
+        """
+        target = np.asarray(measured, dtype=np.float64)
+        with self._lock:
+            count = len(self._names)
+            if count == 0:
+                return []
+            signatures = self._matrix[:count]
+            sse = squared_errors(signatures, target, weights)
+            order = rank_order(sse, self._names, k)
+            return [(self._names[i], float(sse[i]), signatures[i].tolist()) for i in order]
+
+
+def squared_errors(signatures, target, weights=None):
+    """(Weighted) sum of squared differences of every row against target"""
+    diff = signatures - target
+    if weights is None:
+        return np.einsum("ij,ij->i", diff, diff)
+    return np.einsum("ij,ij,j->i", diff, diff, np.asarray(weights, dtype=np.float64))
+
+
+def top_k(scores, k=None, with_ties=False):
+    """Indices of the k lowest scores in ascending order (all if k is None).
+
+    with_ties also returns every other index that ties the k-th score.
+    """
+    if k is not None and 0 < k < len(scores):
+        top = np.argpartition(scores, k - 1)[:k]
+        if with_ties:
+            top = np.flatnonzero(scores <= scores[top].max())
+        return top[np.argsort(scores[top], kind="stable")]
+    return np.argsort(scores, kind="stable")
+
+
+def rank_order(scores, names, k=None):
+    """Indices of the k lowest scores, equal scores ordered by name.
+
+    Matches the (sse, ic_name) order of ICStore.rank_signatures.
+    """
+    order = top_k(scores, k, with_ties=True)
+    ordered = scores[order]
+    if len(order) > 1 and np.any(ordered[1:] == ordered[:-1]):
+        order = np.array(sorted(order.tolist(), key=lambda i: (scores[i], names[i])), dtype=np.intp)
+    if k is not None and 0 < k < len(order):
+        order = order[:k]
+    return order
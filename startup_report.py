@@ -0,0 +1,57 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupReport:
+    """Where startup time goes, in the foreground and the background.
+
+    phase() times a step, mark() records a milestone (e.g. the first idle
+    Tk loop); both are stored as offsets from start. Steps named in
+    expect() must all finish before on_complete(report) is called, once.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, start=None, on_complete=None):
+        self.start = time.perf_counter() if start is None else start
+        self.on_complete = on_complete
+        self.entries = []
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def expect(self, *names):
+        with self._lock:
+            self._pending.update(names)
+
+    def add(self, name, began, duration=None):
+        """Record a step that started at perf_counter() time began"""
+        with self._lock:
+            self.entries.append((name, began - self.start, duration))
+            self._pending.discard(name)
+            done = not self._pending
+        if done and self.on_complete:
+            callback, self.on_complete = self.on_complete, None
+            callback(self)
+
+    @contextmanager
+    def phase(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, began, time.perf_counter() - began)
+
+    def mark(self, name):
+        self.add(name, time.perf_counter())
+
+    def summary(self):
+        """One line per entry, in the order they started"""
+        with self._lock:
+            entries = sorted(self.entries, key=lambda entry: entry[1])
+        lines = []
+        for name, offset, duration in entries:
+            if duration is None:
+                lines.append(f"{offset:7.3f} s  {name}")
+            else:
+                lines.append(f"{offset:7.3f} s  {name} ({duration * 1000:.0f} ms)")
+        return lines
@@ -0,0 +1,197 @@
+"""Several test fixtures driven from one process.
+
+Each Station wraps its own ICTester (serial session, buffers, progress and
+results) and runs identifications on its own thread. All stations share
+one signature index and one ICStore, so there is a single in-memory
+library and a single MongoDB client whose connection pool serves every
+station. The threads mostly block on their serial event queues, so one
+host can drive a rack of fixtures.
+"""
+import threading
+import time
+from collections import deque
+
+from nn_index import create_signature_index
+from signature_cache import DEFAULT_CACHE_DIR
+from tester_engine import ICTester
+
+
+class Station:
+    """One fixture: a tester on its own port and thread.
+
+    state, progress, tests, error and results are written by the station
+    thread under _lock, so snapshot() sees them consistently.
+    """
+
+    def __init__(self, name, port, baudrate, tester, protocol="auto", keep_results=100):
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.tester = tester
+        self.state = "idle"
+        self.progress = (0, 0)
+        self.tests = 0
+        self.error = None
+        self.results = deque(maxlen=keep_results)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def last_result(self):
+        with self._lock:
+            return self.results[-1] if self.results else None
+
+    def start(self, count=None, on_result=None, on_event=None):
+        """Run count identifications (forever if None) on a background thread"""
+        if self.running:
+            return
+        self._stop.clear()
+        with self._lock:
+            self.error = None
+            self.state = "starting"
+        self._thread = threading.Thread(target=self._run, args=(count, on_result, on_event),
+                                        name=f"station-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Abort the current test; the port stays open for the next start()"""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.join(5.0)
+        self.tester.close()
+
+    def snapshot(self):
+        """Plain-dict view of the station for status displays"""
+        with self._lock:
+            last = self.results[-1] if self.results else None
+            best = last.matches[0] if last and last.matches else None
+            return {
+                "name": self.name,
+                "port": self.port,
+                "state": self.state,
+                "progress": self.progress,
+                "tests": self.tests,
+                "best": best[0] if best else None,
+                "sse": best[1] if best else None,
+                "error": str(self.error) if self.error else None,
+            }
+
+    def _set_state(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+
+    def _run(self, count, on_result, on_event):
+        try:
+            self.tester.open(self.port, self.baudrate, self.protocol)
+            done = 0
+            while not self._stop.is_set() and (count is None or done < count):
+                self._set_state("testing")
+                result = self.tester.identify(on_event=lambda event, r: self._on_event(event, r, on_event),
+                                              should_stop=self._stop.is_set)
+                if not result.complete:
+                    if self._stop.is_set():
+                        break
+                    # e.g. every frame rejected as an outlier; reported as
+                    # an incomplete test rather than retried silently
+                    self.tester.log("Test incomplete, no signature", stage="acquisition")
+                done += 1
+                with self._lock:
+                    self.tests += 1
+                    self.results.append(result)
+                if on_result:
+                    on_result(self, result)
+            self._set_state("idle")
+        except Exception as e:
+            self._set_state("error", e)
+            self.tester.log(f"Station stopped: {e}", stage="acquisition")
+
+    def _on_event(self, event, result, on_event):
+        with self._lock:
+            self.progress = (len(result.messages), result.target)
+        if on_event:
+            on_event(self, event, result)
+
+
+class StationManager:
+    """Independent stations sharing one signature index and one store.
+
+    tester_options are passed to every ICTester (match_mode, adaptive,
+    max_results, ...). log(message, stage) receives every station's
+    messages prefixed with the station name.
+    """
+
+    def __init__(self, signature_index=None, store=None, log=None, **tester_options):
+        if signature_index is None:
+            signature_index = create_signature_index()
+        self.signature_index = signature_index
+        self.store = store
+        self.log = log or (lambda message, stage="engine": None)
+        self.tester_options = tester_options
+        self.stations = {}
+        # Loads and syncs the shared library; never opens a port
+        self.library = self._create_tester(self.log)
+
+    def _create_tester(self, log):
+        return ICTester(self.signature_index, store=self.store, log=log, **self.tester_options)
+
+    def load_signatures(self, db_name, collection_name, cache_dir=DEFAULT_CACHE_DIR):
+        """Load the shared index once for all stations"""
+        return self.library.load_signatures(db_name, collection_name, cache_dir)
+
+    def add_station(self, port, baudrate=9600, protocol="auto", name=None):
+        name = name or port
+        if name in self.stations:
+            raise ValueError(f"Station {name} already exists")
+
+        def log(message, stage="engine"):
+            self.log(f"[{name}] {message}", stage=stage)
+
+        station = Station(name, port, baudrate, self._create_tester(log), protocol)
+        self.stations[name] = station
+        return station
+
+    def remove_station(self, name):
+        station = self.stations.pop(name, None)
+        if station:
+            station.close()
+        return station is not None
+
+    def start(self, count=None, on_result=None, on_event=None):
+        """Start every station; callbacks run on the station threads"""
+        for station in self.stations.values():
+            station.start(count, on_result, on_event)
+
+    def stop(self):
+        for station in self.stations.values():
+            station.stop()
+
+    def wait(self, timeout=None):
+        """Wait until every station has finished; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for station in self.stations.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            station.join(remaining)
+        return not any(station.running for station in self.stations.values())
+
+    def status(self):
+        return [station.snapshot() for station in self.stations.values()]
+
+    def close(self):
+        """Stop all stations and close their ports (the store is the caller's)"""
+        self.stop()
+        for station in self.stations.values():
+            station.close()
+        self.stations = {}
@@ -0,0 +1,267 @@
+"""Headless acquisition-and-match engine.
+
+ICTester runs identifications without any UI: it keeps a warm serial
+session, folds frames into per-pin statistics (stopping early in adaptive
+mode), and ranks the signature against the local index or MongoDB. GUI.py
+drives it with callbacks, and ic_cli.py runs it unattended. Nothing here
+imports tkinter or matplotlib.
+"""
+import time
+from datetime import datetime
+
+import acquisition
+from acquisition import AcquisitionEngine
+from nn_index import create_signature_index
+from pin_stats import PinStatistics
+from sequential import SequentialSampler
+from signature_cache import DEFAULT_CACHE_DIR, SignatureCache
+
+
+class Identification:
+    """State and outcome of one test run"""
+
+    def __init__(self, target, stats, sampler=None):
+        self.target = target
+        self.stats = stats
+        self.sampler = sampler
+        self.messages = []
+        self.accepted = None
+        self.signature = None
+        self.matches = []
+        self.link = {}
+        self.started = datetime.now()
+        self.duration = None
+
+    @property
+    def complete(self):
+        return self.signature is not None
+
+    @property
+    def reason(self):
+        if self.sampler and self.sampler.decided:
+            return self.sampler.reason
+        return "fixed count" if self.complete else "incomplete"
+
+    def weights(self):
+        return self.stats.weights()
+
+    def to_record(self, number=None):
+        """Flat dict for JSON lines / CSV output"""
+        best = self.matches[0] if self.matches else (None, None, None)
+        runner_up = self.matches[1] if len(self.matches) > 1 else (None, None, None)
+        return {
+            "n": number,
+            "timestamp": self.started.isoformat(timespec="seconds"),
+            "best": best[0],
+            "sse": best[1],
+            "runner_up": runner_up[0],
+            "runner_up_sse": runner_up[1],
+            "messages": len(self.messages),
+            "outliers": self.stats.outliers,
+            "reason": self.reason,
+            "duration_s": round(self.duration, 3) if self.duration is not None else None,
+            "signature": self.signature,
+            "matches": [{"name": name, "sse": sse} for name, sse, _ in self.matches],
+            "link": self.link,
+        }
+
+
+class ICTester:
+    """Acquisition, signature statistics and matching without a UI.
+
+    log(message, stage) receives progress messages; match_mode is "local"
+    (in-memory index, synced from the signature cache) or "server"
+    (MongoDB aggregation).
+    """
+
+    def __init__(self, signature_index=None, store=None, match_mode="local", max_results=10,
+                 adaptive=True, fixed_messages=5, min_messages=1, max_messages=10,
+                 confidence=0.99, weight_noisy_pins=False, log=None):
+        if signature_index is None:
+            signature_index = create_signature_index()
+        self.signature_index = signature_index
+        self.store = store
+        self.match_mode = match_mode
+        self.max_results = max_results
+        self.adaptive = adaptive
+        self.fixed_messages = fixed_messages
+        self.min_messages = min_messages
+        self.max_messages = max_messages
+        self.confidence = confidence
+        self.weight_noisy_pins = weight_noisy_pins
+        self.log = log or (lambda message, stage="engine": None)
+        self.signature_cache = None
+        self.session = None
+        self._library = None
+        self._skipped_compact = 0
+
+    # Library
+
+    def load_signatures(self, db_name, collection_name, cache_dir=DEFAULT_CACHE_DIR):
+        """Load the on-disk signature cache and delta-sync it from MongoDB"""
+        self._library = (db_name, collection_name, cache_dir)
+        cache = SignatureCache(db_name, collection_name, cache_dir)
+        if self.signature_cache and self.signature_cache.path == cache.path:
+            cache = self.signature_cache
+        elif cache.load():
+            self.log(f"Loaded {len(cache)} signatures from local cache", stage="database")
+
+        self.signature_cache = cache
+
+        if self.store is not None:
+            try:
+                stats = cache.sync(self.store)
+                cache.save()
+                self.log(f"Signature cache synced: {stats['changed']} changed, "
+                         f"{stats['removed']} removed", stage="database")
+            except Exception as e:
+                self.log(f"Signature sync failed, using local cache: {e}", stage="database")
+
+        self.signature_index.load_arrays(cache.names, cache.readings)
+        return cache
+
+    def rank(self, measured, k, weights=None, match_mode=None):
+        """Top-k matches [(name, sse, readings)] using match_mode (default self.match_mode)"""
+        if (match_mode or self.match_mode) == "server":
+            if self.store is None:
+                return []
+            # SSE and top-k computed by an aggregation pipeline
+            matches, skipped = self.store.rank_signatures(measured, k, weights)
+            if skipped != self._skipped_compact:
+                self._skipped_compact = skipped
+                if skipped:
+                    self.log(f"Warning: server matching skipped {skipped} compact (Binary) "
+                             f"signatures; expand them with migrate.py or use local matching",
+                             stage="database")
+            return matches
+
+        if not self.signature_index.loaded and self._library:
+            self.load_signatures(*self._library)
+
+        # Batched SSE with partial sort of the top matches
+        return self.signature_index.rank(measured, k=k, weights=weights)
+
+    def _rank_while_sampling(self, measured, k, weights=None, match_mode=None):
+        """rank() for the sampler: a failure counts as nothing to rank"""
+        try:
+            return self.rank(measured, k, weights, match_mode)
+        except Exception as e:
+            self.log(f"Ranking failed while sampling: {e}", stage="database")
+            return []
+
+    # Acquisition
+
+    def open(self, port, baudrate, protocol="auto", **options):
+        """Open a serial session, reusing the current one if its settings match"""
+        if self.session and self.session.running and self.session.settings() == (port, baudrate, protocol):
+            return self.session
+
+        self.close()
+        self.log(f"Connecting to {port}...", stage="acquisition")
+        self.session = AcquisitionEngine(port, baudrate, protocol=protocol, **options)
+        self.session.start()
+        self.log("Connected", stage="acquisition")
+        return self.session
+
+    def close(self):
+        if self.session:
+            try:
+                self.session.stop()
+                self.log("Serial closed", stage="acquisition")
+            except Exception as e:
+                self.log(f"Error closing serial: {e}", stage="acquisition")
+        self.session = None
+
+    def identify(self, on_event=None, should_stop=None, match=True, match_mode=None):
+        """Collect one signature and, if match is set, rank it.
+
+        on_event(event, identification) is called for every acquisition
+        event after the engine has processed it; should_stop() is polled to
+        abort. match_mode overrides self.match_mode for this run. Returns an
+        Identification whose signature is None when the run was aborted
+        before any frame was accepted.
+        """
+        if self.session is None:
+            raise RuntimeError("No serial session; call open() first")
+        match_mode = match_mode or self.match_mode
+
+        def rank_while_sampling(measured, k, weights=None):
+            return self._rank_while_sampling(measured, k, weights, match_mode)
+
+        stats = PinStatistics()
+        if self.adaptive:
+            sampler = SequentialSampler(rank_while_sampling, self.min_messages,
+                                        self.max_messages, self.confidence, stats=stats,
+                                        fallback_messages=self.fixed_messages,
+                                        weighted=self.weight_noisy_pins)
+            target = self.max_messages
+        else:
+            sampler = None
+            target = self.fixed_messages
+        result = Identification(target, stats, sampler)
+
+        start = time.monotonic()
+        self.session.begin_capture()
+        try:
+            while len(result.messages) < target and not (should_stop and should_stop()):
+                event = self.session.get(timeout=0.2)
+                if event is None:
+                    continue
+                kind, idx, payload = event
+
+                if kind == acquisition.ERROR:
+                    raise payload
+
+                decided = False
+                if kind == acquisition.FRAME:
+                    result.messages.append(list(payload))
+                    result.accepted = stats.add(payload)
+                    if result.accepted and sampler:
+                        decided = sampler.update()
+
+                if on_event:
+                    on_event(event, result)
+                if decided:
+                    break
+        finally:
+            self.session.end_capture()
+
+        result.link = self.session.link_stats()
+        link = result.link
+        self.log(f"Link quality ({link['protocol']}): {link['frames']} frames, "
+                 f"{link['dropped_frames']} dropped, {link['repaired_frames']} repaired, "
+                 f"{link['resyncs']} resyncs, {link['invalid']} invalid lines, "
+                 f"{link['crc_errors']} CRC errors", stage="acquisition")
+
+        if sampler and sampler.decided:
+            best = sampler.best
+            self.log(f"Stopped after {len(result.messages)} messages ({sampler.reason})"
+                     + (f", best match {best[0]}" if best else ""), stage="acquisition")
+
+        if stats.count and (len(result.messages) == target or (sampler and sampler.decided)):
+            result.signature = stats.mean.tolist()
+            if match:
+                weights = result.weights() if self.weight_noisy_pins else None
+                result.matches = self.rank(result.signature, self.max_results, weights, match_mode)
+        result.duration = time.monotonic() - start
+        return result
+
+    def save(self, ic_name, result, comparison_results=None):
+        """Store a signature; returns True if a new IC was created"""
+        comparison_results = comparison_results if comparison_results is not None else result.matches
+        doc = {
+            "ic_name": ic_name,
+            "readings": result.signature,
+            "timestamp": datetime.now(),
+            "messages": result.messages,
+            **result.stats.summary(),
+            "comparison_results": [
+                {"name": name, "sse": sse}
+                for name, sse, _ in comparison_results[:5]
+            ]
+        }
+
+        # Upsert in a single round trip
+        created = self.store.save(ic_name, doc)
+        self.signature_index.upsert(ic_name, result.signature)
+        return created
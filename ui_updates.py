@@ -0,0 +1,70 @@
+import threading
+from collections import namedtuple
+
+
+UIBatch = namedtuple("UIBatch", "values progress status calls")
+
+
+class UIUpdateQueue:
+    """Thread-safe hand-off of widget updates to the Tk loop.
+
+    Worker threads post updates here instead of touching widgets; the Tk
+    loop takes one batch per tick and repaints once. Pin values, progress
+    and status are last-writer-wins (overwritten updates count as merged),
+    and call() runs arbitrary Tk code in order. Log lines go through
+    EventLog, whose ring buffer the Tk loop reads on the same tick.
+    """
+
+    def __init__(self):
+        self.stats = {"posted": 0, "merged": 0, "ticks": 0}
+        self._lock = threading.Lock()
+        self._values = {}
+        self._progress = None
+        self._status = None
+        self._calls = []
+
+    def set_value(self, index, value):
+        with self._lock:
+            self.stats["posted"] += 1
+            if index in self._values:
+                self.stats["merged"] += 1
+            self._values[index] = value
+
+    def set_values(self, values):
+        """Post several pin values as one update (e.g. clearing all labels)"""
+        with self._lock:
+            self.stats["posted"] += 1
+            self.stats["merged"] += sum(1 for index in range(len(values)) if index in self._values)
+            self._values.update(enumerate(values))
+
+    def set_progress(self, current, total):
+        with self._lock:
+            self.stats["posted"] += 1
+            if self._progress is not None:
+                self.stats["merged"] += 1
+            self._progress = (current, total)
+
+    def set_status(self, text):
+        with self._lock:
+            self.stats["posted"] += 1
+            if self._status is not None:
+                self.stats["merged"] += 1
+            self._status = text
+
+    def call(self, fn, *args):
+        with self._lock:
+            self.stats["posted"] += 1
+            self._calls.append((fn, args))
+
+    def take(self):
+        """Everything posted since the last tick, or None if nothing was"""
+        with self._lock:
+            self.stats["ticks"] += 1
+            if not (self._values or self._progress or self._status is not None or self._calls):
+                return None
+            batch = UIBatch(self._values, self._progress, self._status, self._calls)
+            self._values = {}
+            self._progress = None
+            self._status = None
+            self._calls = []
+            return batch
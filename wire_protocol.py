@@ -0,0 +1,119 @@
+"""Binary framed wire protocol between the tester firmware and the GUI.
+
+A frame carries raw 10-bit ADC codes instead of formatted voltages:
+
+    magic A5 5A | seq (u16) | count (u8) | count x code (u16) | CRC (u16)
+
+All fields are little-endian. The CRC is CRC-16/CCITT (poly 0x1021, init
+0xFFFF) over everything after the magic. count is 8 for a monitor cycle and
+64 for a full channel scan.
+
+The host asks for binary mode by sending REQUEST_BINARY; firmware that
+understands it answers with an ACK_BINARY line before switching. Older
+firmware ignores the byte and keeps sending ASCII lines.
+"""
+import binascii
+import struct
+
+import numpy as np
+
+
+FRAME_MAGIC = b"\xa5\x5a"
+HEADER = struct.Struct("<2sHB")
+CRC = struct.Struct("<H")
+CODE_DTYPE = np.dtype("<u2")
+
+MAX_CHANNELS = 64
+ADC_FULL_SCALE = 1024
+DEFAULT_VREF = 5.0
+
+REQUEST_BINARY = b"B"
+REQUEST_ASCII = b"A"
+ACK_BINARY = "#BIN"
+ACK_ASCII = "#ASCII"
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, codes):
+    """Build a frame from ADC codes (what the firmware sends)"""
+    codes = np.asarray(codes, dtype=CODE_DTYPE)
+    body = HEADER.pack(FRAME_MAGIC, seq & 0xFFFF, len(codes))[2:] + codes.tobytes()
+    return FRAME_MAGIC + body + CRC.pack(crc16(body))
+
+
+class BinaryFrameDecoder:
+    """Finds CRC-checked frames in a byte stream.
+
+    Codes are read with np.frombuffer straight out of the receive buffer
+    and scaled to volts (or copied as raw codes when scale is None).
+    Corrupted frames are skipped by searching for the next magic.
+    """
+
+    def __init__(self, scale=DEFAULT_VREF / ADC_FULL_SCALE, max_channels=MAX_CHANNELS):
+        self.scale = scale
+        self.max_channels = max_channels
+        self.stats = {"binary_frames": 0, "crc_errors": 0, "lost_frames": 0, "skipped_bytes": 0}
+        self._pending = bytearray()
+        self._last_seq = None
+
+    def reset(self):
+        """Forget partial input, e.g. after reopening the port"""
+        self._pending = bytearray()
+        self._last_seq = None
+
+    def feed(self, data):
+        """Return [(seq, values)] for the complete frames in data, in order"""
+        buf = self._pending
+        buf += data
+        frames = []
+        pos = 0
+
+        with memoryview(buf) as view:
+            while True:
+                start = buf.find(FRAME_MAGIC, pos)
+                if start < 0:
+                    # A trailing first magic byte may start the next frame
+                    keep = 1 if buf.endswith(FRAME_MAGIC[:1]) else 0
+                    self.stats["skipped_bytes"] += len(buf) - pos - keep
+                    pos = len(buf) - keep
+                    break
+                self.stats["skipped_bytes"] += start - pos
+                pos = start
+                if len(buf) - start < HEADER.size:
+                    break
+
+                _, seq, count = HEADER.unpack_from(buf, start)
+                end = start + HEADER.size + count * CODE_DTYPE.itemsize + CRC.size
+                if not 0 < count <= self.max_channels:
+                    pos = start + 1
+                    self.stats["skipped_bytes"] += 1
+                    continue
+                if len(buf) < end:
+                    break
+
+                (crc,) = CRC.unpack_from(buf, end - CRC.size)
+                if crc16(view[start + len(FRAME_MAGIC):end - CRC.size]) != crc:
+                    self.stats["crc_errors"] += 1
+                    self.stats["skipped_bytes"] += 1
+                    pos = start + 1
+                    continue
+
+                codes = np.frombuffer(buf, dtype=CODE_DTYPE, count=count,
+                                      offset=start + HEADER.size)
+                values = codes * self.scale if self.scale else codes.copy()
+                del codes
+                frames.append((seq, values))
+                self._track(seq)
+                pos = end
+
+        del buf[:pos]
+        return frames
+
+    def _track(self, seq):
+        if self._last_seq is not None:
+            self.stats["lost_frames"] += (seq - self._last_seq - 1) & 0xFFFF
+        self._last_seq = seq
+        self.stats["binary_frames"] += 1